@@ -419,6 +419,22 @@ def is_xml():
 def is_doc():
     return getattr(__import__('util.filetype', fromlist=['is_doc']), 'is_doc')
 
+@lazyobject
+def sniff():
+    return getattr(__import__('util.filetype', fromlist=['sniff']), 'sniff')
+
+@lazyobject
+def sniffcache():
+    return getattr(__import__('util.filetype', fromlist=['sniffcache']), 'sniffcache')
+
+@lazyobject
+def setsniffcache():
+    return getattr(__import__('util.filetype', fromlist=['setsniffcache']), 'setsniffcache')
+
+@lazyobject
+def texttype():
+    return getattr(__import__('util.filetype', fromlist=['texttype']), 'texttype')
+
 @lazyobject
 def readrow():
     return getattr(__import__('util.io', fromlist=['readrow']), 'readrow')
@@ -427,6 +443,30 @@ def readrow():
 def grouprow():
     return getattr(__import__('util.io', fromlist=['grouprow']), 'grouprow')
 
+@lazyobject
+def csvrows():
+    return getattr(__import__('util.io', fromlist=['csvrows']), 'csvrows')
+
+@lazyobject
+def rangerows():
+    return getattr(__import__('util.io', fromlist=['rangerows']), 'rangerows')
+
+@lazyobject
+def maprows():
+    return getattr(__import__('util.io', fromlist=['maprows']), 'maprows')
+
+@lazyobject
+def byteranges():
+    return getattr(__import__('util.io', fromlist=['byteranges']), 'byteranges')
+
+@lazyobject
+def countbytes():
+    return getattr(__import__('util.io', fromlist=['countbytes']), 'countbytes')
+
+@lazyobject
+def xlsxrows():
+    return getattr(__import__('util.io', fromlist=['xlsxrows']), 'xlsxrows')
+
 @lazyobject
 def to_tsv():
     return getattr(__import__('util.io', fromlist=['to_tsv']), 'to_tsv')
@@ -519,6 +559,10 @@ def compute_object_size():
 def kwtolist():
     return getattr(__import__('util.utils', fromlist=['kwtolist']), 'kwtolist')
 
+@lazyobject
+def pmap():
+    return getattr(__import__('util.utils', fromlist=['pmap']), 'pmap')
+
 @lazyobject
 def csvreader():
     return getattr(__import__('util.utils', fromlist=['csvreader']), 'csvreader')
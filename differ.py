@@ -14,113 +14,221 @@ __author__ = "m.yama"
 
 __all__ = ["differ"]
 
+import os
 from functools import  lru_cache
 from itertools import zip_longest
 import re
 from operator import itemgetter
 import sys
-from itertools import tee
+from collections import _count_elements, defaultdict
 
 
+BASE_TYPE = [type(None), int, float, str, bytes, bytearray, bool]
+
+@lru_cache(maxsize=16)
+def compare(x, y, conditional_value=' ---> ', delstr='DEL', addstr='ADD'):
+    if x == y:
+        return x
+    elif x and y:
+        return "{}{}{}".format(x, conditional_value, y)
+    elif x:
+        return "{}{}{}".format(x, conditional_value, delstr)
+    else:
+        return "{}{}{}".format(addstr, conditional_value, y)
+
+def sanitize(a, b, **kw):
+    if type(a) in BASE_TYPE and type(b) in BASE_TYPE:
+        return compare(a, b, **kw)
+    else:
+        return [compare(x, y, **kw) for x, y in zip_longest(a, b, fillvalue="")]
+
+def flatten(x):
+    try:
+        result = []
+        for y in x:
+            if type(y) in BASE_TYPE:
+                result.append(y)
+            else:
+                result.extend(flatten(y))
+        return tuple(result)
+    except TypeError:
+        return (x, )
+
+def deephash(x):
+    try:
+        return tuple([hash(y) if type(y) in BASE_TYPE else deephash(y) for y in x])
+    except:
+        return (hash(x), )
+
+def snake(k:int, y:int, left:object, right:object):
+    x = y - k
+    while x < len(left) and y < len(right) and left[x] == right[y]:
+        x += 1
+        y += 1
+    return y
+
+def common_rate(o1, o2, m):
+    c1, c2 = {}, {}
+    _count_elements(c1, o1)
+    _count_elements(c2, o2)
+    if len(c1) > len(c2):
+        c1, c2 = c2, c1
+    get = c2.get
+    common = 0
+    for k, n in c1.items():
+        v = get(k, 0)
+        common += n if n < v else v
+    return 1.0 - ((m - common) / m)
+
+@lru_cache()
+def similar(left, right, min_rate=0.0):
+    """
+        Parameters:
+            left: ex.tuple (Compare target data left)
+            right: ex.tuple (Compare target data right)
+            min_rate: float (give up as soon as the rate can not reach min_rate)
+        Return:
+            float (0.0 < return <= 1.000000000002)
+              less than min_rate (an upper bound of the rate) when min_rate is unreachable
+    """
+    if left == right:
+        return 1.0
+
+    if not (left and right):
+        return 0.0
+
+    try:
+        l1, l2 = len(left), len(right)
+        o1, o2 = left, right
+    except:
+        o1 = list(left)
+        o2 = list(right)
+        l1, l2 = len(o1), len(o2)
+
+    m = max(l1, l2)
+    if min_rate > 0:
+        bound = 1.0 - (abs(l1 - l2) / m)
+        if bound < min_rate:
+            return bound
+        try:
+            bound = common_rate(o1, o2, m)
+        except TypeError:
+            bound = 1.0
+        if bound < min_rate:
+            return bound
+
+    s1 = o2 if l1 > l2 else o1
+    s2 = o1 if l1 > l2 else o2
+    sl1 = len(s1)
+    sl2 = len(s2)
+    fp = defaultdict(lambda:-1)
+    offset = sl1 + 1
+    delta = sl2 - sl1
+
+    p = 0
+    while fp[delta + offset] != sl2:
+        if min_rate > 0:
+            bound = 1.0 - ((delta + p) / m)
+            if bound < min_rate:
+                return bound
+        for k in range(-p, delta):
+            fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
+        for k in range(delta + p, delta, -1):
+            fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
+        fp[delta + offset] = snake(delta, max(fp[delta-1+offset] + 1, fp[delta+1+offset]), s1, s2)
+
+        p += 1
+    ed = delta + (p - 1)
+    return 1.0 - (ed / m)
+
+python_kernel = dict(flatten=flatten, deephash=deephash, sanitize=sanitize, similar=similar)
+
 try:
     from util.libs.similar import similar, flatten, sanitize, deephash
 
     from functools import  _CacheInfo, _lru_cache_wrapper
     similar = _lru_cache_wrapper(similar, 128, False, _CacheInfo)
-except:
-    from collections import _count_elements
-    from collections import defaultdict
-
-    BASE_TYPE = [type(None), int, float, str, bytes, bytearray, bool]
-
-    @lru_cache(maxsize=16)
-    def compare(x, y, conditional_value=' ---> ', delstr='DEL', addstr='ADD'):
-        if x == y:
-            return x
-        elif x and y:
-            return "{}{}{}".format(x, conditional_value, y)
-        elif x:
-            return "{}{}{}".format(x, conditional_value, delstr)
+    BACKEND = "cython"
+    BACKEND_ERROR = None
+except ImportError as e:
+    BACKEND = "python"
+    BACKEND_ERROR = e
+
+
+def isframe(seq):
+    """ numpy ndarray (1d or 2d) or pandas DataFrame """
+    t = type(seq)
+    if t.__name__ == "ndarray" and t.__module__ == "numpy":
+        return seq.ndim in (1, 2)
+    return t.__name__ == "DataFrame"
+
+def uniqueby(seq, startidx=0, return_counts=False):
+    """
+        Vectorized unique rows of numpy ndarray or pandas DataFrame.
+        rows are sorted by `np.lexsort` and split where the adjacent rows differ,
+        object columns of DataFrame are compared by `pandas.util.hash_pandas_object`.
+
+        Return:
+            None (object dtype ndarray, can not be vectorized)
+            or tuple (unique rows as python values in order of appearance,
+                      index lists of each unique row or counts if return_counts)
+    """
+    import numpy as np
+
+    arr = seq
+    if type(seq).__name__ == "DataFrame":
+        arr = seq.to_numpy()
+        if arr.dtype == object:
+            from pandas.util import hash_pandas_object
+            codes = hash_pandas_object(seq, index=False).to_numpy()
         else:
-            return "{}{}{}".format(addstr, conditional_value, y)
+            codes = arr
+    elif arr.dtype == object:
+        return None
+    else:
+        codes = arr
 
-    def sanitize(a, b, **kw):
-        if type(a) in BASE_TYPE and type(b) in BASE_TYPE:
-            return compare(a, b, **kw)
-        else:
-            return [compare(x, y, **kw) for x, y in zip_longest(a, b, fillvalue="")]
+    n = len(codes)
+    if n == 0:
+        return [], []
 
-    def flatten(x):
-        try:
-            result = []
-            for y in x:
-                if type(y) in BASE_TYPE:
-                    result.append(y)
-                else:
-                    result.extend(flatten(y))
-            return tuple(result)
-        except TypeError:
-            return (x, )
+    if codes.ndim == 2:
+        order = np.lexsort(codes.T[::-1])
+        s = codes[order]
+        diff = (s[1:] != s[:-1]).any(axis=1)
+    else:
+        order = np.argsort(codes, kind="stable")
+        s = codes[order]
+        diff = s[1:] != s[:-1]
 
-    def deephash(x):
-        try:
-            return tuple([hash(y) if type(y) in BASE_TYPE else deephash(y) for y in x])
-        except:
-            return (hash(x), )
-
-    def snake(k:int, y:int, left:object, right:object):
-        x = y - k
-        while x < len(left) and y < len(right) and left[x] == right[y]:
-            x += 1
-            y += 1
-        return y
-
-    @lru_cache()
-    def similar(left, right):
-        """
-            Parameters:
-                left: ex.tuple (Compare target data left)
-                right: ex.tuple (Compare target data right)
-            Return:
-                float (0.0 < return <= 1.000000000002)
-        """
-        if left == right:
-            return 1.0
+    starts = np.flatnonzero(np.concatenate(([True], diff)))
+    ends = np.append(starts[1:], n)
+    first = order[starts]
+    appear = np.argsort(first, kind="stable")
 
-        if not (left and right):
-            return 0.0
+    rows = (seq.iloc[first[appear]].to_numpy() if arr is not seq and arr.dtype == object else arr[first[appear]]).tolist()
 
-        try:
-            l1, l2 = len(left), len(right)
-            o1, o2 = left, right
-        except:
-            o1 = list(left)
-            o2 = list(right)
-            l1, l2 = len(o1), len(o2)
-
-        s1 = o2 if l1 > l2 else o1
-        s2 = o1 if l1 > l2 else o2
-        sl1 = len(s1)
-        sl2 = len(s2)
-        fp = defaultdict(lambda:-1)
-        offset = sl1 + 1
-        delta = sl2 - sl1
-
-        p = 0
-        while fp[delta + offset] != sl2:
-            for k in range(-p, delta):
-                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
-            for k in range(delta + p, delta, -1):
-                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
-            fp[delta + offset] = snake(delta, max(fp[delta-1+offset] + 1, fp[delta+1+offset]), s1, s2)
-
-            p += 1
-        ed = delta + (p - 1)
-        return 1.0 - (ed / max(l1,l2))
+    if return_counts:
+        return rows, (ends - starts)[appear].tolist()
 
+    order = (order + startidx).tolist()
+    return rows, [order[i:j] for i, j in zip(starts[appear].tolist(), ends[appear].tolist())]
 
 def countby(seq, func=None, return_index=False):
     result = {}
+    if func and isframe(seq):
+        uq = uniqueby(seq, return_counts=True)
+        if uq is not None:
+            indexes = {}
+            for row, n in zip(*uq):
+                key = func(row)
+                if key in result:
+                    result[key] += n
+                else:
+                    result[key] = n
+                    indexes[key] = row
+            return (result, indexes) if return_index else result
+
     if func:
         if return_index:
             indexes = {}
@@ -145,6 +253,19 @@ def countby(seq, func=None, return_index=False):
 
 def groupby(seq, func=None, return_index=False, startidx=0):
     result = {}
+    if func and isframe(seq):
+        uq = uniqueby(seq, startidx)
+        if uq is not None:
+            indexes = {}
+            for row, idx in zip(*uq):
+                key = func(row)
+                if key in result:
+                    result[key] = sorted(result[key] + idx)
+                else:
+                    result[key] = idx
+                    indexes[key] = row
+            return (result, indexes) if return_index else result
+
     if func:
         if return_index:
             indexes = {}
@@ -157,39 +278,109 @@ def groupby(seq, func=None, return_index=False, startidx=0):
                     indexes[key] = value
             return result, indexes
         else:
-            for i, value in enumerate(seq):
+            for i, value in enumerate(seq, startidx):
                 key = func(value)
                 if key in result:
                     result[key].append(i)
                 else:
                     result[key] = [i]
     else:
-        for i, key in enumerate(seq):
+        for i, key in enumerate(seq, startidx):
             if key in result:
                 result[key].append(i)
             else:
                 result[key] = [i]
     return result
 
-def differ(a, b, header=False, diffonly=False, sort=True, reverse=False, rep_rate=0.6, na_val=None, startidx=0, **kw):
-    result = []
-
-    if hasattr(a, "__next__"):
-        a, _a = tee(a)
-        ca = countby(_a, deephash)
-    else:
-        ca = countby(a, deephash)
-
-    if hasattr(b, "__next__"):
-        b, _b = tee(b)
-        cb = countby(_b, deephash)
-    else:
-        cb = countby(b, deephash)
-
-    ga, ia = groupby(a, deephash, return_index=True, startidx=startidx)
-    gb, ib = groupby(b, deephash, return_index=True, startidx=startidx)
+class candidates(object):
+    """
+        Inverted index of row tokens (deephash elements) for pruning `similar` pairs.
+        edit distance >= longer length - common tokens,
+        so a pair whose common token count is below `rate * longer length` can not reach `rate`.
+    """
+    def __init__(self, rows):
+        self.rank = {}
+        self.length = {}
+        self.index = {}
+        for i, row in enumerate(rows):
+            self.rank[row] = i
+            self.length[row] = len(row)
+            for token, n in self.tokencount(row).items():
+                if token in self.index:
+                    self.index[token].append((row, n))
+                else:
+                    self.index[token] = [(row, n)]
+
+    @staticmethod
+    def tokencount(row):
+        result = {}
+        _count_elements(result, row)
+        return result
+
+    def common(self, row):
+        """ Return: dict (indexed row -> common token count with `row`) """
+        common = {}
+        get = common.get
+        for token, n in self.tokencount(row).items():
+            for other, m in self.index.get(token, ()):
+                common[other] = get(other, 0) + (n if n < m else m)
+        return common
+
+    def __call__(self, row, rate, alive=None):
+        """
+            Parameters:
+                row: deephash tuple
+                rate: minimum similar rate
+                alive: container of still available rows (default all indexed rows)
+            Return:
+                list (candidate rows in indexed order)
+        """
+        l1 = len(row)
+        length = self.length
+        result = []
+        for other, n in self.common(row).items():
+            if alive is not None and other not in alive:
+                continue
+            l2 = length[other]
+            if n >= rate * (l1 if l1 > l2 else l2) - 1e-9:
+                result.append(other)
+        result.sort(key=self.rank.__getitem__)
+        return result
 
-    cab = ca.keys() & cb.keys()
+    def bounds(self, row, rate):
+        """
+            Return:
+                list (upper bound of similar rate, candidate row)
+                  in bound descending and indexed order
+        """
+        l1 = len(row)
+        length = self.length
+        rank = self.rank
+        result = []
+        for other, n in self.common(row).items():
+            l2 = length[other]
+            bound = n / (l1 if l1 > l2 else l2)
+            if bound >= rate - 1e-9:
+                result.append((-bound, rank[other], other))
+        result.sort()
+        return [(-b, other) for b, _, other in result]
+
+def indexsort(na_val=None):
+    def key(x):
+        i, j = x[1:3]
+        return ([i, j][i == na_val], [j, 0][j == na_val])
+    return key
+
+def matching(ga, gb, ia, diffonly=False):
+    """
+        Parameters:
+            ga, gb: dict (deephash -> index list)
+            ia: dict (deephash -> row value)
+        Return:
+            tuple (equal results, remain of ga, remain of gb)
+    """
+    result = []
+    cab = ga.keys() & gb.keys()
 
     ra = {k:ga[k] for k in (ga.keys() - cab)}
     rb = {k:gb[k] for k in (gb.keys() - cab)}
@@ -199,34 +390,125 @@ def differ(a, b, header=False, diffonly=False, sort=True, reverse=False, rep_rat
             val = ia[k]
             result.extend([flatten(("equal", x, y, val)) for x, y in zip(ga[k], gb[k])])
 
-        i, j = ca[k], cb[k]
+        i, j = len(ga[k]), len(gb[k])
         if i < j:
             rb[k] = gb[k][i:]
         elif i > j:
             ra[k] = ga[k][j:]
 
-    del cab, ca, cb, ga, gb
+    return result, ra, rb
+
+def assignment(ra, rb, rep_rate=0.6, topk=1):
+    """
+        Global replace pairing of the unmatched rows.
+        the `topk` best candidates of each row are scored once,
+        then the edges are matched greedily by (score desc, index_a, index_b),
+        rows which lost all of their full top-k are searched again in the remaining rows.
+        (consumes `ra` and `rb`)
+
+        Return:
+            list (repa, repb, index list a, index list b)
+    """
+    from heapq import heappush, heappushpop
+
+    cand = candidates(sorted(rb, key=lambda k: rb[k][0]))
+    rank = cand.rank
+    order = sorted(ra, key=lambda k: ra[k][0])
+
+    edges = []
+    full = set()
+    for repa in order:
+        heap = []
+        for bound, repb in cand.bounds(repa, rep_rate):
+            full_heap = len(heap) >= topk
+            if full_heap and bound < heap[0][0]:
+                break
+            r = similar(repa, repb, heap[0][0] if full_heap and heap[0][0] > rep_rate else rep_rate)
+            if r < rep_rate:
+                continue
+            item = (r, -rank[repb], repb)
+            if not full_heap:
+                heappush(heap, item)
+            elif item > heap[0]:
+                heappushpop(heap, item)
+        if len(heap) >= topk:
+            full.add(repa)
+        ra0 = ra[repa][0]
+        edges.extend((-r, ra0, -nrank, repa, repb) for r, nrank, repb in heap)
+
+    result = []
+
+    def pair(repa, repb):
+        ida, idb = ra[repa], rb[repb]
+        n = min(len(ida), len(idb))
+        result.append((repa, repb, ida[:n], idb[:n]))
+        if ida[n:]:
+            ra[repa] = ida[n:]
+        else:
+            del ra[repa]
+        if idb[n:]:
+            rb[repb] = idb[n:]
+        else:
+            del rb[repb]
+
+    edges.sort()
+    for *_, repa, repb in edges:
+        if repa in ra and repb in rb:
+            pair(repa, repb)
+    del edges
 
-    if 0 < rep_rate and rep_rate < 1:
-        for repa, ida in ra.items():
+    for repa in order:
+        while repa in full and repa in ra and rb:
             rate = -1.0
             ret = None
-            for repb, idb in rb.items():
-                r = similar(repa, repb)
+            for repb in cand(repa, rep_rate, rb):
+                r = similar(repa, repb, rate if rate > rep_rate else rep_rate)
+                if r > rate:
+                    rate = r
+                    ret = repb
+            if rate < rep_rate:
+                break
+            pair(repa, ret)
+
+    return result
+
+def replacing(ra, rb, ia, ib, rep_rate=0.6, na_val=None, pairing="greedy"):
+    """
+        replace / delete / insert results of the unmatched rows (consumes `rb`)
+        pairing: `greedy` (first come best match) or `global` (see `assignment`)
+    """
+    if 0 < rep_rate and rep_rate < 1 and pairing == "global":
+        for repa, repb, ida, idb in assignment(ra, rb, rep_rate):
+            val = sanitize(ia[repa], ib[repb])
+            yield from (flatten(("replace", x, y, val)) for x, y in zip(ida, idb))
+
+        for k, v in ra.items():
+            val = ia[k]
+            yield from (flatten(("delete", i, na_val, val)) for i in v)
+
+    elif 0 < rep_rate and rep_rate < 1:
+        # rows are paired in order of their first index, so the result does not depend on dict order
+        cand = candidates(sorted(rb, key=lambda k: rb[k][0]))
+        for repa, ida in sorted(ra.items(), key=lambda x: x[1][0]):
+            rate = -1.0
+            ret = None
+            for repb in cand(repa, rep_rate, rb):
+                idb = rb[repb]
+                r = similar(repa, repb, rate if rate > rep_rate else rep_rate)
                 if r < rate:
                     continue
                 rate = r
                 ret = (repb, idb)
             if rate < rep_rate:
                 val = ia[repa]
-                result.extend([flatten(("delete", x, na_val, val)) for x in ida])
+                yield from (flatten(("delete", x, na_val, val)) for x in ida)
                 continue
 
             repb, idb = ret
 
             val = sanitize(ia[repa], ib[repb])
             z = list(zip(ida, idb))
-            result.extend([flatten(("replace", x, y, val)) for x, y in z])
+            yield from (flatten(("replace", x, y, val)) for x, y in z)
 
             yy = idb[len(z):]
             if yy:
@@ -236,27 +518,479 @@ def differ(a, b, header=False, diffonly=False, sort=True, reverse=False, rep_rat
     else:
         for k, v in ra.items():
             val = ia[k]
-            result.extend([flatten(("delete", i, na_val, val)) for i in v])
-
-    del ra, ia
+            yield from (flatten(("delete", i, na_val, val)) for i in v)
 
     for k, v in rb.items():
         val = ib[k]
-        result.extend([flatten(("insert", na_val, i, val)) for i in v])
+        yield from (flatten(("insert", na_val, i, val)) for i in v)
+
+def headerrow(maxcol):
+    return ["tag", "index_a", "index_b", *map("col_{:02d}".format, range(maxcol))]
+
+def differ(a, b, header=False, diffonly=False, sort=True, reverse=False, rep_rate=0.6, na_val=None, startidx=0, pairing="greedy", **kw):
+    ga, ia = groupby(a, deephash, return_index=True, startidx=startidx)
+    gb, ib = groupby(b, deephash, return_index=True, startidx=startidx)
+
+    result, ra, rb = matching(ga, gb, ia, diffonly)
+
+    del ga, gb
+
+    result.extend(replacing(ra, rb, ia, ib, rep_rate, na_val, pairing))
 
-    del rb, ib
+    del ra, rb, ia, ib
 
     if result:
         if sort:
-            def indexsort(x):
-                i, j = x[1:3]
-                return ([i, j][i == na_val], [j, 0][j == na_val])
-            result.sort(key=indexsort, reverse=reverse)
+            result.sort(key=indexsort(na_val), reverse=reverse)
 
         if header:
             maxcol = max(map(len, result)) - 3
-            head = [["tag", "index_a", "index_b", *map("col_{:02d}".format, range(maxcol))]]
-            result = head + result
+            result = [headerrow(maxcol)] + result
+    return result
+
+def idiffer(a, b, header=False, diffonly=False, reverse=False, rep_rate=0.6, na_val=None, startidx=0, pairing="greedy", **kw):
+    """
+        Streaming `differ` (sorted) generator.
+        the equal rows are kept as one sorted list of (index_a, index_b, deephash),
+        merged with the replace / delete / insert results sorted on the first pull,
+        so no equal row is built before it is yielded.
+    """
+    from heapq import merge
+
+    ga, ia = groupby(a, deephash, return_index=True, startidx=startidx)
+    gb, ib = groupby(b, deephash, return_index=True, startidx=startidx)
+
+    _, ra, rb = matching(ga, gb, ia, diffonly=True)
+    pairs = [] if diffonly else [(i, j, k) for k in ga.keys() & gb.keys() for i, j in zip(ga[k], gb[k])]
+    del ga, gb
+    pairs.sort(reverse=reverse)
+
+    sortkey = indexsort(na_val)
+
+    def rest():
+        nonlocal ra, rb, ib
+        ret = list(replacing(ra, rb, ia, ib, rep_rate, na_val, pairing))
+        ra = rb = ib = None
+        ret.sort(key=sortkey, reverse=reverse)
+        return ret
+
+    def lazy():
+        yield from rest()
+
+    if header:
+        it = rest()
+        maxcol = max(map(len, it)) - 3 if it else -1
+        for k in {k for *_, k in pairs}:
+            maxcol = max(maxcol, len(flatten(ia[k])))
+        if maxcol >= 0:
+            yield headerrow(maxcol)
+    else:
+        it = lazy()
+
+    equal = (flatten(("equal", i, j, ia[k])) for i, j, k in pairs)
+    yield from merge(equal, it, key=sortkey, reverse=reverse)
+
+def keydiffer(a, b, key, header=False, diffonly=False, sort=True, reverse=False, na_val=None, startidx=0, **kw):
+    """
+        Key column aligned `differ`.
+
+        Rows are joined by `key` (column indexes or names, see `selector`) in O(n),
+        same key rows are compared column by column with `sanitize`
+        and rows without a matching key are deleted or inserted.
+        (duplicated keys are paired in order of appearance,
+         a key column missing in a short row is None)
+    """
+    from collections import deque
+
+    a = a if isinstance(a, list) else list(a)
+    b = b if isinstance(b, list) else list(b)
+
+    if callable(key):
+        getter = key
+    else:
+        # key column indexes: numbers (ranges as `selector`) are checked against the widest row,
+        # names are looked up in the header a[0]
+        width = max(map(len, a + b), default=0)
+        if isinstance(key, str) and not re.search("[^0-9,\-]", key):
+            cols = []
+            for x in key.split(","):
+                s, _, e = x.partition("-")
+                cols.extend(range(int(s), int(e or s) + 1))
+        else:
+            names = key.split(",") if isinstance(key, str) else list(key)
+            try:
+                cols = list(map(int, names))
+            except ValueError:
+                head = a[0] if a else []
+                missing = [x for x in names if x not in head]
+                if missing:
+                    raise ValueError("key column `{}` is not in the header".format(",".join(map(str, missing))))
+                cols = [head.index(x) for x in names]
+        if not cols or min(cols) < 0 or max(cols) >= width:
+            raise ValueError("key column `{}` is out of range of all rows".format(key))
+        cols = tuple(cols)
+        it = itemgetter(*cols)
+        last = max(cols)
+
+        if len(cols) == 1:
+            def short(row):
+                return None
+        else:
+            def short(row):
+                return tuple(row[c] if c < len(row) else None for c in cols)
+
+        def getter(rows):
+            return (it(row) if len(row) > last else short(row) for row in rows)
+
+    gb = {}
+    for j, k in enumerate(getter(b), startidx):
+        if k in gb:
+            gb[k].append(j)
+        else:
+            gb[k] = deque([j])
+
+    result = []
+    for i, (k, row) in enumerate(zip(getter(a), a), startidx):
+        v = gb.get(k)
+        if not v:
+            result.append(flatten(("delete", i, na_val, row)))
+            continue
+
+        j = v.popleft()
+        other = b[j - startidx]
+        if deephash(row) != deephash(other):
+            result.append(flatten(("replace", i, j, sanitize(row, other))))
+        elif not diffonly:
+            result.append(flatten(("equal", i, j, row)))
+
+    for v in gb.values():
+        result.extend(flatten(("insert", na_val, j, b[j - startidx])) for j in v)
+
+    del gb
+
+    if result:
+        if sort:
+            result.sort(key=indexsort(na_val), reverse=reverse)
+
+        if header:
+            maxcol = max(map(len, result)) - 3
+            result = [headerrow(maxcol)] + result
+    return result
+
+def spilldiffer(a, b, header=False, diffonly=False, reverse=False, rep_rate=0.6, na_val=None, startidx=0, buckets=64, tmpdir=None, pairing="greedy", **kw):
+    """
+        External memory `differ` for inputs larger than RAM.
+
+        Both inputs are hash partitioned by `deephash` into `buckets` files,
+        exact matches are resolved bucket by bucket and written as sorted runs,
+        only the unmatched rows are kept in memory for the replace pass,
+        and the runs are k-way merged into a sorted result generator.
+        (memory is bounded by a bucket plus the unmatched rows, so it grows with the number of
+         differing rows. the result is the same as `differ`)
+    """
+    import pickle
+    from heapq import merge
+    from tempfile import TemporaryDirectory
+
+    def partition(rows, prefix):
+        files = [open(os.path.join(tdir, "{}{:04d}".format(prefix, n)), "wb") for n in range(buckets)]
+        try:
+            for i, row in enumerate(rows, startidx):
+                pickle.dump((i, row), files[hash(deephash(row)) % buckets], pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in files:
+                f.close()
+        return [f.name for f in files]
+
+    def load(path):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+
+    def grouping(path, ia):
+        g = {}
+        for i, row in load(path):
+            key = deephash(row)
+            if key in g:
+                g[key].append(i)
+            else:
+                g[key] = [i]
+                ia[key] = row
+        return g
+
+    sortkey = indexsort(na_val)
+    maxcol = 0
+
+    with TemporaryDirectory(dir=tmpdir) as tdir:
+        pa = partition(a, "a")
+        pb = partition(b, "b")
+
+        runs = []
+        ra, rb, ia, ib = {}, {}, {}, {}
+        for n, (fa, fb) in enumerate(zip(pa, pb)):
+            _ia, _ib = {}, {}
+            result, _ra, _rb = matching(grouping(fa, _ia), grouping(fb, _ib), _ia, diffonly)
+            os.remove(fa)
+            os.remove(fb)
+
+            ra.update(_ra)
+            rb.update(_rb)
+            ia.update((k, _ia[k]) for k in _ra)
+            ib.update((k, _ib[k]) for k in _rb)
+            del _ia, _ib, _ra, _rb
+
+            if result:
+                result.sort(key=sortkey, reverse=reverse)
+                maxcol = max(maxcol, max(map(len, result)) - 3)
+                run = os.path.join(tdir, "run{:04d}".format(n))
+                with open(run, "wb") as f:
+                    for r in result:
+                        pickle.dump(r, f, pickle.HIGHEST_PROTOCOL)
+                runs.append(run)
+            del result
+
+        rest = list(replacing(ra, rb, ia, ib, rep_rate, na_val, pairing))
+        del ra, rb, ia, ib
+        rest.sort(key=sortkey, reverse=reverse)
+
+        if rest:
+            maxcol = max(maxcol, max(map(len, rest)) - 3)
+
+        if header and (runs or rest):
+            yield headerrow(maxcol)
+
+        yield from merge(*map(load, runs), rest, key=sortkey, reverse=reverse)
+
+def rowdigest(row):
+    """
+        stable 64bit digest of a row.
+        (`deephash` uses `hash` which is salted per process, so it can not be persisted)
+    """
+    from hashlib import blake2b
+    return int.from_bytes(blake2b(repr(row).encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+class snapshot(object):
+    """
+        Row digest snapshot of a csv file saved as sidecar `<path>.dsnap`.
+        `digests` and `offsets` are arrays of the row digest and the row start byte offset,
+        so that a later diff re-reads only the rows it needs from the source file.
+
+        sidecar layout: magic, version, header length (`struct` "<4sII"), json header
+        (encoding, dialect, size, mtime, rows) and the little endian bytes of `digests` and `offsets`.
+    """
+    suffix = ".dsnap"
+    magic = b"DSNP"
+    version = 2
+
+    def __init__(self, path, encoding=None, dialect=None, size=None, mtime=None, digests=None, offsets=None):
+        from array import array
+        self.path = path
+        self.encoding = encoding
+        self.dialect = dialect or {}
+        self.size = size
+        self.mtime = mtime
+        self.digests = array("Q") if digests is None else digests
+        self.offsets = array("Q") if offsets is None else offsets
+        self.cached = False
+
+    def __len__(self):
+        return len(self.digests)
+
+    @property
+    def sidecar(self):
+        return self.path + self.suffix
+
+    @property
+    def fresh(self):
+        st = os.stat(self.path)
+        return self.size == st.st_size and self.mtime == st.st_mtime_ns
+
+    @classmethod
+    def load(cls, path):
+        """ snapshot of the `path` from the fresh sidecar, else scanned from the source file """
+        from struct import error
+
+        sidecar = path + cls.suffix
+        if os.path.exists(sidecar):
+            try:
+                snap = cls.frombytes(path, open(sidecar, "rb").read())
+                if snap and snap.fresh:
+                    snap.cached = True
+                    return snap
+            except (OSError, ValueError, TypeError, KeyError, error):
+                pass
+        return cls.scan(path)
+
+    @classmethod
+    def frombytes(cls, path, dat):
+        """ Return: snapshot of the sidecar bytes `dat`, None if it is not the current version """
+        import json
+        import struct
+        from array import array
+
+        fmt = "<4sII"
+        n = struct.calcsize(fmt)
+        magic, version, hlen = struct.unpack(fmt, dat[:n])
+        if magic != cls.magic or version != cls.version:
+            return None
+        kw = json.loads(dat[n:n + hlen].decode("utf-8"))
+        rows = kw.pop("rows")
+        arrays = []
+        for i in range(2):
+            start = n + hlen + i * rows * 8
+            x = array("Q", dat[start:start + rows * 8])
+            if len(x) != rows:
+                raise ValueError("truncated sidecar {}".format(path + cls.suffix))
+            if sys.byteorder != "little":
+                x.byteswap()
+            arrays.append(x)
+        return cls(path, digests=arrays[0], offsets=arrays[1], **kw)
+
+    def tobytes(self):
+        import json
+        import struct
+
+        head = json.dumps(dict(encoding=self.encoding, dialect=self.dialect, size=self.size,
+                               mtime=self.mtime, rows=len(self))).encode("utf-8")
+        ret = [struct.pack("<4sII", self.magic, self.version, len(head)), head]
+        for x in (self.digests, self.offsets):
+            if sys.byteorder != "little":
+                x = x[:]
+                x.byteswap()
+            ret.append(x.tobytes())
+        return b"".join(ret)
+
+    def save(self):
+        with open(self.sidecar, "wb") as f:
+            f.write(self.tobytes())
+
+    @staticmethod
+    def lines(fp, encoding, pos):
+        for line in fp:
+            pos[0] += len(line)
+            yield line.decode(encoding)
+
+    @classmethod
+    def scan(cls, path):
+        import csv
+        from util.filetype import sniff, dialectparams
+
+        st = os.stat(path)
+        sn = sniff(path)
+        encoding = sn.encoding or "utf-8"
+        dialect = sn.dialect or dialectparams(csv.excel)
+
+        snap = cls(path, encoding, dialect, st.st_size, st.st_mtime_ns)
+        with open(path, "rb") as fp:
+            pos = [0]
+            start = 0
+            for row in csv.reader(cls.lines(fp, encoding, pos), **dialect):
+                snap.offsets.append(start)
+                snap.digests.append(rowdigest(row))
+                start = pos[0]
+        return snap
+
+    def rows(self, indexes, startidx=0):
+        """ re-read the rows of `indexes` from the source file. Return: dict (index -> row) """
+        return dict(self.iterrows(sorted(set(indexes)), startidx))
+
+    def iterrows(self, indexes, startidx=0):
+        """
+            re-read the rows of ascending `indexes` from the source file,
+            a run of consecutive rows is read on without seeking.
+            Return: generator of (index, row)
+        """
+        import csv
+        nxt = reader = None
+        with open(self.path, "rb") as fp:
+            for i in indexes:
+                if i != nxt:
+                    fp.seek(self.offsets[i - startidx])
+                    reader = csv.reader(self.lines(fp, self.encoding, [0]), **self.dialect)
+                yield i, next(reader)
+                nxt = i + 1
+
+def snapdiffer(a, b, header=False, diffonly=False, sort=True, reverse=False, rep_rate=0.6, na_val=None, startidx=0, save=True, pairing="greedy", **kw):
+    """
+        Incremental `differ` of 2 csv files by row digest snapshots.
+
+        Parameters:
+            a, b: csv file path (or `snapshot`)
+            save: write `b` (and a scanned `a`) snapshot sidecar for the next run
+        Return:
+            same as differ(a rows, b rows)
+    """
+    from heapq import merge
+
+    sa = a if isinstance(a, snapshot) else snapshot.load(a)
+    sb = b if isinstance(b, snapshot) else snapshot.load(b)
+    if save:
+        for s in (sa, sb):
+            if not s.cached:
+                s.save()
+
+    ga = groupby(sa.digests, startidx=startidx)
+    gb = groupby(sb.digests, startidx=startidx)
+
+    cab = ga.keys() & gb.keys()
+    ra = {k:ga[k] for k in (ga.keys() - cab)}
+    rb = {k:gb[k] for k in (gb.keys() - cab)}
+
+    equal = []
+    for k in cab:
+        equal.append((ga[k], gb[k]))
+        i, j = len(ga[k]), len(gb[k])
+        if i < j:
+            rb[k] = gb[k][i:]
+        elif i > j:
+            ra[k] = ga[k][j:]
+    del ga, gb
+
+    rowa = sa.rows((v[0] for v in ra.values()), startidx)
+    rowb = sb.rows((v[0] for v in rb.values()), startidx)
+
+    # the equal rows are read only when printed, from `a` in index order (equal digest is equal row)
+    pairs = [] if diffonly else sorted(p for x, y in equal for p in zip(x, y))
+    del equal
+
+    def rehash(r, rows):
+        ret, ir = {}, {}
+        for v in r.values():
+            val = rows[v[0]]
+            k = deephash(val)
+            if k in ret:
+                ret[k] = sorted(ret[k] + v)
+            else:
+                ret[k] = v
+                ir[k] = val
+        return ret, ir
+
+    ra, ia = rehash(ra, rowa)
+    rb, ib = rehash(rb, rowb)
+    del rowa, rowb
+
+    result = list(replacing(ra, rb, ia, ib, rep_rate, na_val, pairing))
+    del ra, rb, ia, ib
+
+    if pairs:
+        rows = sa.iterrows((i for i, j in pairs), startidx)
+        eq = (flatten(("equal", i, j, row)) for (i, j), (_, row) in zip(pairs, rows))
+        if sort:
+            key = indexsort(na_val)
+            result.sort(key=key, reverse=reverse)
+            eq = reversed(list(eq)) if reverse else eq
+            result = list(merge(eq, result, key=key, reverse=reverse))
+        else:
+            result = list(eq) + result
+    elif result and sort:
+        result.sort(key=indexsort(na_val), reverse=reverse)
+
+    if result and header:
+        maxcol = max(map(len, result)) - 3
+        result = [headerrow(maxcol)] + result
     return result
 
 def to_excel(rows, outputfile, sheetname="Sheet1",
@@ -350,18 +1084,91 @@ def selector(key, start=0, tar="target"):
                 return map(it, x)
         return  getter
 
+def guesskey(rows, header=True):
+    from util.profiler import profile_data, guess_key
+    keys = guess_key(profile_data(rows, header=0 if header else None, top=0), 1, rows[1:] if header else rows)
+    return keys[0] if keys else None
+
+def _differ(a, b, key=None, hasheader=True, **kw):
+    if key:
+        a = a if isinstance(a, list) else list(a)
+        if key == "auto":
+            key = guesskey(a, hasheader)
+        if key is not None:
+            return keydiffer(a, b, key, **kw)
+    return differ(a, b, **kw)
+
+def targetnames(path, select=None):
+    """
+        target (sheet, member ...) names of a file for the target diff of `main`.
+        xlsx sheet names are read without parsing the sheets,
+        other files are read one target at a time and the values are dropped.
+
+        Parameters:
+            select: `selector` of the targets
+        Return:
+            list
+    """
+    from util.io import grouprow, pinfo
+    from util.filetype import guesstype
+
+    if guesstype(path) == "xlsx":
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True)
+        names = [pinfo(path, ws.title, None) for ws in wb.worksheets]
+        wb.close()
+    else:
+        names = [pinfo(path, t, None) for t in dict.fromkeys(x.target for x in grouprow(path))]
+    return [x.target for x in (select(names) if select else names)]
+
+def _loadtarget(path, target):
+    """
+        value of a target of a file (the other targets are skipped by the reader `targets` filter if it has).
+        readers not overridden by grouprow (zip, tar ...) yield a row at a time, their rows are collected.
+    """
+    from inspect import signature
+    from util.io import grouprow
+
+    if target is None:
+        return None
+    func = grouprow.handler(path)
+    name = getattr(func, "func", func).__name__
+    it = func(path, targets=[target]) if "targets" in signature(func).parameters else func(path)
+    if name in vars(grouprow):
+        return next((x.value for x in it if x.target == target), None)
+    return [x.value for x in it if x.target == target]
+
+def _simtar(job):
+    tag, tar, a, b, key, hasheader, kw = job
+    na_value = kw.get("na_val")
+    a, b = _loadtarget(*a), _loadtarget(*b)
+
+    if tag in ("equal", "replace"):
+        rows = _differ(a, b, key, hasheader, **kw)
+    elif tag == "delete":
+        rows = ([tag, j, na_value, *r] for j, r in enumerate(a, 1))
+    elif tag == "insert":
+        rows = ([tag, na_value, j, *r] for j, r in enumerate(b, 1))
+    else:
+        return []
+
+    return [[tar, *r] for r in rows]
+
 def main():
     import os
     from argparse import ArgumentParser
     from operator import attrgetter
-    from util.io import readrow, grouprow, to_csv, to_tsv, unicode_escape
-    from util.filetype import guesstype
+    from util.io import readrow, to_csv, to_tsv, unicode_escape
+    from util.filetype import guesstype, setsniffcache
+    from util.utils import pmap
 
     ps = ArgumentParser(prog="differ",
                         description="2 file diff compare program\n")
     padd = ps.add_argument
 
     padd('-V','--version', action='version', version='%(prog)s ' + __version__)
+    padd("-v", "--verbose", help="print similar backend",
+         action='store_true', default=False)
     padd('file1', nargs=1, help='diff before file')
     padd('file2', nargs=1, help='diff after file')
 
@@ -384,6 +1191,21 @@ def main():
     padd('-C', '--condition_value', type=str, default=" ---> ",
          help='Delimiter String of Replace Value (default ` ---> `)')
 
+    padd('-k', '--key', type=str, default=None,
+         help='key columns index or names of row join (ex. 0,2 or id,name), `auto` is guess by profiler (default whole row)')
+    padd('-j', '--jobs', type=int, default=1,
+         help='parallel process number of multi sheet or target diff (default `1`, `0` is cpu count)')
+    padd('-P', '--pairing', type=str, default="greedy", choices=["greedy", "global"],
+         help='replace pairing of unmatched rows (default `greedy`, `global` is deterministic top-k assignment)')
+    padd('-S', '--snapshot', action='store_true', default=False,
+         help='incremental csv diff by row digest snapshot sidecar `<file>.dsnap` (default `False`)')
+    padd('-b', '--buckets', type=int, default=0,
+         help='spill to disk with N hash buckets for larger than memory files, the unmatched rows are still paired in memory (default `0` is in memory)')
+    padd('-T', '--tmpdir', type=str, default=None,
+         help='spill directory of --buckets (default system temp)')
+    padd('--sniffcache', type=str, default=None,
+         help='sniff cache database path, keeps file types and csv dialects between runs (default None is in memory)')
+
     padd('-t', '--target', type=selector, default=None,
          help='target table names or sheetname (ex. Sheet1, Sheet3)')
     padd('-t1', '--target1', type=selector, default=None,
@@ -393,6 +1215,16 @@ def main():
 
     args = ps.parse_args()
 
+    if args.sniffcache:
+        setsniffcache(args.sniffcache)
+
+    if args.verbose:
+        if BACKEND_ERROR:
+            sys.stderr.write("differ: similar backend `{}` ({})\n".format(BACKEND, BACKEND_ERROR))
+        else:
+            sys.stderr.write("differ: similar backend `{}`\n".format(BACKEND))
+        sys.stderr.flush()
+
     p1 = args.file1[0]
     p2 = args.file2[0]
 
@@ -407,59 +1239,66 @@ def main():
 
     conditional_value = args.condition_value
 
+    if args.snapshot:
+        if args.key:
+            ps.error("--snapshot can not be used with --key")
+        if args.buckets > 0:
+            ps.error("--snapshot can not be used with --buckets")
+        if not (guesstype(p1) == guesstype(p2) == "csv"):
+            ps.error("--snapshot is only for csv files")
+
     notarget = ["ppt","doc","csv","txt","html","pickle"]
     if guesstype(p1) not in notarget and guesstype(p2) not in notarget:
 
-        #TODO very big data dictionary memory NG
-        tar1select = args.target1 or args.target
-        tar2select = args.target2 or args.target
-        a = {x.target:x.value for x in (tar1select(grouprow(p1)) if tar1select else grouprow(p1))}
-        b = {x.target:x.value for x in (tar2select(grouprow(p2)) if tar2select else grouprow(p2))}
+        # only the target names are read here, each job loads its own pair of targets,
+        # so memory is bounded by the targets in flight of the pmap window
+        a = targetnames(p1, args.target1 or args.target)
+        b = targetnames(p2, args.target2 or args.target)
 
         #similar target
         kw = dict(
-            header=header,
             diffonly=diffonly,
             rep_rate=rep_rate,
             na_val=na_value,
             startidx=1,
+            pairing=args.pairing,
             conditional_value=conditional_value)
 
-        def _simtar(tag, tar, a, b, i):
-            kw["header"] = i==0 and kw["header"]
-
-            if tag == "equal":
-                row = ([tar,*r] for r in differ(a[tar], b[tar], **kw))
-            elif tag == "replace":
-                ta, tb = tar.split(conditional_value)
-                row = ([tar,*r] for r in differ(a[ta], b[tb], **kw))
-            elif tag == "delete":
-                row = ([tar, tag, j, na_value,*r] for j, r in enumerate(a[tar], 1))
-            elif tag == "insert":
-                row = ([tar, tag, na_value, j, *r] for j, r in enumerate(b[tar], 1))
-            else:
-                return []
-
-            return row
+        def simjobs():
+            for i, (tag, *_, tar) in enumerate(differ(a, b)):
+                ta, tb = tar.split(conditional_value) if tag == "replace" else (tar, tar)
+                ta = None if tag == "insert" else ta
+                tb = None if tag == "delete" else tb
+                yield tag, tar, (p1, ta), (p2, tb), args.key, header, dict(kw, header=i==0 and header)
 
         it = (["targetname", *r[1:]] if r[1] == "tag" else r
-                  for i, (tag, *_, tar) in enumerate(differ(a, b))
-                      for r in _simtar(tag, tar, a, b, i))
+                  for rows in pmap(_simtar, simjobs(), args.jobs)
+                      for r in rows)
 
     else:
-        a = map(attrgetter("value"), readrow(p1))
-        b = map(attrgetter("value"), readrow(p2))
-
-        it = differ(
-            a, b,
+        kw = dict(
             header=header,
             diffonly=diffonly,
             rep_rate=rep_rate,
             na_val=na_value,
             startidx=1,
+            pairing=args.pairing,
             conditional_value=conditional_value
         )
 
+        if args.snapshot:
+            it = snapdiffer(p1, p2, **kw)
+        else:
+            a = map(attrgetter("value"), readrow(p1))
+            b = map(attrgetter("value"), readrow(p2))
+
+            if args.key:
+                it = _differ(a, b, args.key, header, **kw)
+            elif args.buckets > 0:
+                it = spilldiffer(a, b, buckets=args.buckets, tmpdir=args.tmpdir, **kw)
+            else:
+                it = idiffer(a, b, **kw)
+
     if outputfile is None:
         return to_csv(it, sys.stdout, encoding=encoding, sep=sep)
 
@@ -472,12 +1311,63 @@ def main():
     else:
         to_csv(it, outputfile, encoding=encoding, lineterminator=lineterminator)
 
+def benchmark(sizes=(10000, 100000, 1000000), ncol=10, change_rate=0.1, seed=0, file=sys.stderr):
+    """
+        python vs native kernel (flatten, deephash, sanitize, similar) benchmark
+        on synthetic rows. every size diffs `size` rows against a copy with
+        `change_rate` of the rows modified in one column.
+    """
+    from random import Random
+    from time import perf_counter
+    from importlib import import_module
+
+    kernels = [("python", python_kernel)]
+    try:
+        native = import_module("util.libs.similar")
+        kernels.append(("cython", dict(
+            flatten=native.flatten,
+            deephash=native.deephash,
+            sanitize=native.sanitize,
+            similar=native.similar)))
+    except ImportError as e:
+        print("cython backend is not available ({})".format(e), file=file)
+
+    words = ["{:x}".format(i * 2654435761 % 4294967296) for i in range(1000)]
+    form = "{:<8}{:>10}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}"
+    print("{:<8}{:>10}{:>12}{:>12}{:>12}{:>12}".format("backend", "rows", "flatten", "deephash", "sanitize", "similar"), file=file)
+
+    for n in sizes:
+        rnd = Random(seed)
+        a = [[rnd.choice(words) for _ in range(ncol)] for _ in range(n)]
+        b = [list(r) for r in a]
+        for r in rnd.sample(b, int(n * change_rate)):
+            r[rnd.randrange(ncol)] = rnd.choice(words)
+
+        for name, k in kernels:
+            fl, dh, sn, sm = k["flatten"], k["deephash"], k["sanitize"], k["similar"]
+            t = [perf_counter()]
+            for x in a:
+                fl(x)
+            t.append(perf_counter())
+            ha = [dh(x) for x in a]
+            hb = [dh(x) for x in b]
+            t.append(perf_counter())
+            for x, y in zip(a, b):
+                sn(x, y)
+            t.append(perf_counter())
+            for x, y in zip(ha, hb):
+                sm(x, y)
+            t.append(perf_counter())
+            print(form.format(name, n, *(j - i for i, j in zip(t, t[1:]))), file=file)
+            file.flush()
+
 def test():
     from util.core import tdir
     from util.io import readrow
 
     from datetime import datetime as dt
     from io import StringIO
+    import csv
 
 
     def test_sanitize():
@@ -501,6 +1391,33 @@ def test():
         assert(1 > similar(deephash("abc"), deephash("abb")) > 0.6)
         assert(similar(deephash(("abc",)), deephash(("abb",))) == 0.0)
 
+    def test_similar_min_rate():
+        a, b = deephash("abcdefgh"), deephash("abcdefxy")
+        r = similar(a, b)
+        assert(similar(a, b, r) == r)
+        assert(similar(a, b, r + 0.01) < r + 0.01)
+        assert(similar(deephash("abc"), deephash("abcdefgh"), 0.5) < 0.5)
+        assert(similar(deephash("abcd"), deephash("wxyz"), 0.5) < 0.5)
+
+    def test_groupby_frame():
+        try:
+            import numpy as np
+        except ModuleNotFoundError:
+            return
+        rows = [[1, 2], [3, 4], [1, 2], [5, 6], [3, 4]]
+        for seq in [np.array(rows), np.array(rows, dtype=float)]:
+            assert(groupby(seq, deephash, True, 1) == groupby(seq.tolist(), deephash, True, 1))
+            assert(countby(seq, deephash) == countby(seq.tolist(), deephash))
+        assert(groupby(np.array([3, 1, 3]), deephash) == {deephash(3): [0, 2], deephash(1): [1]})
+        assert(differ(np.array(rows), np.array(rows[1:])) == differ(rows, rows[1:]))
+
+    def test_candidates():
+        rows = [deephash(list("abc")), deephash(list("xyz")), deephash(list("abd"))]
+        cand = candidates(rows)
+        assert(cand(deephash(list("abz")), 0.6) == [rows[0], rows[2]])
+        assert(cand(deephash(list("abz")), 0.6, {rows[2]: 1}) == [rows[2]])
+        assert(cand(deephash(list("klm")), 0.6) == [])
+
     def test_differ1d():
         a = "abc"
         b = "bcd"
@@ -516,6 +1433,104 @@ def test():
         assert(list(differ(a, b)) == [('equal', 0, 0, 'a', 'b', 'c'), ('replace', 1, 1, 'a', 'b ---> c', 'c'), ('insert', None, 2, 'x', 't', 'z')])
         assert(differ(a, b, startidx=1) == [('equal', 1, 1, 'a', 'b', 'c'), ('replace', 2, 2, 'a', 'b ---> c', 'c'), ('insert', None, 3, 'x', 't', 'z')])
 
+    def test_spilldiffer():
+        a = [list("abc"), list("abc"), list("klm")]
+        b = [list("abc"),list("acc"), list("xtz")]
+        for buckets in [1, 3, 16]:
+            assert(list(spilldiffer(a, b, buckets=buckets)) == differ(a, b))
+            assert(list(spilldiffer(a, b, buckets=buckets, header=True, diffonly=True)) == differ(a, b, header=True, diffonly=True))
+        assert(list(spilldiffer("abc", "bcd", startidx=1, buckets=2)) == differ("abc", "bcd", startidx=1))
+        assert(list(spilldiffer([], [])) == [])
+
+        from random import Random
+        for seed in range(200):
+            rnd = Random(seed)
+            a = [[rnd.choice("abcd") for _ in range(4)] for _ in range(rnd.randrange(1, 30))]
+            b = [list(r) for r in a]
+            for r in rnd.sample(b, min(len(b), rnd.randrange(4))):
+                r[rnd.randrange(4)] = rnd.choice("abcdx")
+            b.append([rnd.choice("abcd") for _ in range(4)])
+            for buckets in [1, 7]:
+                assert(list(spilldiffer(a, b, buckets=buckets)) == differ(a, b))
+
+    def test_idiffer():
+        a = [list("abc"), list("abc"), list("klm"), list("xyz")]
+        b = [list("abc"), list("acc"), list("xyz"), list("xtz"), list("abc")]
+        for kw in [{}, dict(diffonly=True), dict(header=True), dict(reverse=True), dict(startidx=1, na_val="-")]:
+            assert(list(idiffer(a, b, **kw)) == differ(a, b, **kw))
+        assert(list(idiffer("abc", "bcd")) == differ("abc", "bcd"))
+        assert(list(idiffer([], [], header=True)) == [])
+        from random import Random
+        rnd = Random(0)
+        for _ in range(100):
+            a = [[rnd.choice("abc") for _ in range(rnd.randrange(1, 4))] for _ in range(rnd.randrange(20))]
+            b = [[rnd.choice("abc") for _ in range(rnd.randrange(1, 4))] for _ in range(rnd.randrange(20))]
+            for kw in [dict(header=True), dict(reverse=True, diffonly=True)]:
+                assert(list(idiffer(a, b, **kw)) == differ(a, b, **kw))
+
+    def test_keydiffer():
+        a = [["id", "v"], ["1", "a"], ["2", "b"], ["3", "c"]]
+        b = [["id", "v"], ["3", "c"], ["1", "x"], ["4", "d"]]
+        assert(keydiffer(a, b, "0", diffonly=True) == [('replace', 1, 2, '1', 'a ---> x'), ('delete', 2, None, '2', 'b'), ('insert', None, 3, '4', 'd')])
+        assert(keydiffer(a, b, "id", diffonly=True) == keydiffer(a, b, [0], diffonly=True))
+        assert(keydiffer(a, b, "id", header=True)[0] == ["tag", "index_a", "index_b", "col_00", "col_01"])
+        assert(keydiffer(a, b, "id")[0] == ('equal', 0, 0, 'id', 'v'))
+        assert(keydiffer(a, b, "id")[1] == ('replace', 1, 2, '1', 'a ---> x'))
+        a = [["id", "v"], ["1", "a"], ["2"], []]
+        b = [["id", "v"], ["2", "b"], [], ["1", "a"]]
+        assert(keydiffer(a, b, "1", diffonly=True) == [('insert', None, 1, '2', 'b'), ('replace', 2, 2, '2 ---> DEL'), ('delete', 3, None)])
+        assert(keydiffer(a, b, "0,1", diffonly=True) == [('insert', None, 1, '2', 'b'), ('delete', 2, None, '2')])
+        for k in ["5", "nokey"]:
+            try:
+                keydiffer(a, b, k)
+                raise AssertionError
+            except ValueError:
+                pass
+        # a short first row, the key column is in range of the data rows
+        a = [["title"], ["1", "a", "x"], ["2", "b", "y"]]
+        b = [["title"], ["2", "b", "z"], ["3", "c", "w"]]
+        assert(keydiffer(a, b, "1", diffonly=True) == [('delete', 1, None, '1', 'a', 'x'), ('replace', 2, 1, '2', 'b', 'y ---> z'), ('insert', None, 2, '3', 'c', 'w')])
+        assert(keydiffer(a, b, [0, 1], diffonly=True) == keydiffer(a, b, "0-1", diffonly=True))
+        a = [[str(i % 3), str(i)] for i in range(3000)]
+        assert(len(keydiffer(a, list(reversed(a)), "0")) == 3000)
+
+    def test_snapdiffer():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            fa, fb = os.path.join(d, "a.csv"), os.path.join(d, "b.csv")
+            with open(fa, "w", newline="") as f:
+                f.write('id,name\n1,"a\nb"\n2,bb\n2,bb\n3,cc\n')
+            with open(fb, "w", newline="") as f:
+                f.write('id,name\n1,"a\nb"\n2,bb\n3,cx\n4,dd\n')
+            ra = list(csv.reader(open(fa, newline="")))
+            rb = list(csv.reader(open(fb, newline="")))
+            assert(snapdiffer(fa, fb, startidx=1) == differ(ra, rb, startidx=1))
+            assert(os.path.exists(fb + snapshot.suffix))
+            assert(snapshot.load(fb).cached)
+            assert(snapdiffer(fa, fb, header=True, diffonly=True) == differ(ra, rb, header=True, diffonly=True))
+            assert(snapdiffer(fa, fb, startidx=1, reverse=True) == differ(ra, rb, startidx=1, reverse=True))
+
+            sn = snapshot.load(fb)
+            assert(list(sn.digests) == list(snapshot.scan(fb).digests))
+            assert(snapshot.frombytes(fb, sn.tobytes()).offsets == sn.offsets)
+            with open(sn.sidecar, "wb") as f:
+                f.write(b"\x80\x04junk")
+            assert(not snapshot.load(fb).cached)
+
+            # the dialect falls back to the csv defaults when it is not sniffed
+            fc = os.path.join(d, "c.csv")
+            with open(fc, "w", newline="") as f:
+                f.write("a\n")
+            assert(list(snapshot.scan(fc).digests) == [rowdigest(["a"])])
+
+    def test_differ_global():
+        a = [list("abcd"), list("abxx"), list("klmn")]
+        b = [list("abcx"), list("abcd"), list("zzzz")]
+        assert(differ(a, b, pairing="global") == differ(a, b))
+        a = [list("abcd"), list("abce")]
+        b = [list("abcf"), list("abcd"), list("abcd")]
+        assert(differ(a, b, pairing="global", diffonly=True) == [('replace', 1, 0, 'a', 'b', 'c', 'e ---> f'), ('insert', None, 2, 'a', 'b', 'c', 'd')])
+
     def test_differcsv():
         a = (x.value for x in readrow(tdir+"diff1.csv"))
         b = (x.value for x in readrow(tdir+"diff2.csv"))
@@ -590,6 +1605,10 @@ def test():
     def test_main_outfile_txt():
         pass
 
+    def test_main_key():
+        sio = stdoutcapture(["-k", "0", tdir+"diff1.csv", tdir+"diff2.csv"])
+        assert(all(x.replace('"', '').split("\t")[0] != "equal" for x in sio))
+
     def test_target():
         sio = stdoutcapture("-t 0".split(" ") + [tdir+"diff1.xlsx", tdir+"diff2.xlsx"])
         assert(sio.getvalue().count("\n") == 7)
@@ -620,5 +1639,6 @@ def test():
 
 if __name__ == "__main__":
     # test()
+    # benchmark()
     # sys.argv.extend("C:/temp/diff1.xlsx C:/temp/diff2.xlsx".split(" "))
     main()
@@ -8,6 +8,11 @@ __version__ = '0.0.1'
 
 __all__ = [
     "guesstype",
+    "sniff",
+    "sniffcache",
+    "setsniffcache",
+    "texttype",
+    "peekable",
     'is_office',
     'is_tar',
     'is_lha',
@@ -25,9 +30,10 @@ __all__ = [
 
 import os
 import re
+import sys
 from io import BytesIO, StringIO
 import csv
-from chardet import detect
+from collections import namedtuple, OrderedDict
 
 def is_office(b:bytes):
     if b[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
@@ -60,6 +66,9 @@ def is_xls(b:bytes):
             return b"\x00xl/" in b
         if b[30:].startswith(b"mimetypeapplication/vnd.oasis.opendocument.spreadsheet"):
             return True
+        # central directory of a workbook written with another member order (e.g. openpyxl)
+        if b"xl/workbook.xml" in b and b"[Content_Types].xml" in b:
+            return True
     return False
 
 def is_doc(b:bytes):
@@ -99,30 +108,69 @@ def is_text(b:bytes):
 def is_bin(b:bytes):
     return b"\x00" in b
 
+BOM = b"\xef\xbb\xbf"
+
+def _ends(b:bytes):
+    """ first byte after the BOM and the last byte before the trailing spaces """
+    body = b[3:] if b[:3] == BOM else b
+    return body, body[:1], b.rstrip()[-1:]
+
 def is_xml(b:bytes):
-    return is_text(b) and b.lstrip(b"\xef\xbb\xbf")[:13] == b"<?xml version" and b.rstrip()[-1] == 62 # 62 is `>`
+    body, first, last = _ends(b)
+    return is_text(b) and body[:13] == b"<?xml version" and last == b">"
 
+_html = re.compile(b"<html|<!doctype", re.I)
 def is_html(b:bytes):
-    return is_text(b) and b.lstrip(b"\xef\xbb\xbf")[0] == b"<" and b"<html" in b or b"<!doctype" in b and  b.rstrip()[-1] == 62 # 62 is `>`
+    body, first, last = _ends(b)
+    return is_text(b) and first == b"<" and last == b">" and _html.search(b) is not None
 
+# an object closed and another opened on a later line, never in one json value (a string has no raw newline)
+_jsonlines = re.compile(b"}[ \t\r]*\n\s*{")
 def is_json(b:bytes):
-    return is_text(b) and b.lstrip(b"\xef\xbb\xbf")[0] == b"{" and b":" in b and b.rstrip()[-1] == 125 # 125 is `}`
+    body, first, last = _ends(b)
+    return is_text(b) and first == b"{" and last == b"}" and b":" in b and _jsonlines.search(b) is None
 
 sniffer=csv.Sniffer()
 sniffer.preferred = [',', '\t', ';', ' ', ':', '|']
-def is_csv(b:bytes):
+def is_csv(b:bytes, samplebyte=4096):
+    """
+        csv.Sniffer over the head lines (about `samplebyte` bytes) of the data.
+        delimiters and quotes are ascii, so the sample is decoded as latin-1 instead of detecting the encoding.
+    """
+    i = b.rfind(b"\n", 0, samplebyte)
+    sample = b[:i] if i > 0 else b[:samplebyte]
     try:
-        e = detect(b)["encoding"]
-        d = sniffer.sniff(b.decode(e) if e else b.decode())
-        return d.delimiter in sniffer.preferred
+        return sniffer.sniff(sample.decode("latin-1")).delimiter in sniffer.preferred
     except csv.Error:
         return False
 
+_dml = re.compile(b"^\\s*record\\b.*?^\\s*end\\s*;", re.M | re.S)
 def is_dml(b:bytes):
-    try:
-        return is_text(b) and b";" in b and (b.index(b"record") < b.index(b"end"))
-    except ValueError:
-        return False
+    return is_text(b) and _dml.search(b[:65536]) is not None
+
+def texttype(b:bytes, complete=True):
+    """
+        xml, html, json, dml, csv or txt of a text (no NUL byte) data.
+        the ends of the data are computed once and pick the candidates by the first and last byte,
+        then the html, json lines, dml and csv checks each scan the data (in this order, only as needed).
+        the closing byte is checked only if the data is `complete` (not a head only sample of a stream).
+        json lines (one object per line) are txt, the json readers load a single value.
+    """
+    body, first, last = _ends(b)
+    if first == b"<" and (last == b">" or not complete):
+        if body[:13] == b"<?xml version":
+            return "xml"
+        if _html.search(b):
+            return "html"
+    elif first == b"{" and (last == b"}" or not complete) and b":" in b:
+        if _jsonlines.search(b):
+            return "txt"
+        return "json"
+    if is_dml(b):
+        return "dml"
+    if is_csv(b):
+        return "csv"
+    return "txt"
 
 """ referenced by
 https://en.m.wikipedia.org/wiki/List_of_file_signatures
@@ -270,7 +318,37 @@ start = { # bytes startswith define
                 [b'\xff\xfe\x00\x00', 'Byte-order mark for text file encoded in little-endian 32-bit Unicode Transfer Format']]
   }
 
-def lookuptype(x:bytes):
+def maketrie(table):
+    """ byte trie of the `start` table, a node is a dict of byte -> node and None -> filetype """
+    root = {}
+    for sigs in table.values():
+        for sig, name in sigs:
+            node = root
+            for c in sig:
+                node = node.setdefault(c, {})
+            node.setdefault(None, name)
+    return root
+
+trie = maketrie(start)
+
+def longestprefix(x:bytes, root=trie):
+    """ filetype of the longest signature in `start` which `x` starts with """
+    ret = None
+    node = root
+    for c in x:
+        node = node.get(c)
+        if node is None:
+            break
+        if None in node:
+            ret = node[None]
+    return ret
+
+offsets = [ # (filetype, [(offset, bytes), ...]) all bytes at the offsets must match
+    ("tar", [(257, b"ustar")]),
+    ("lha", [(0, b"!"), (2, b"-lh"), (6, b"-")]),
+]
+
+def lookuptype(x:bytes, complete=True):
     if is_bin(x):
         k = x[:2]
         if k == b"PK":
@@ -281,40 +359,145 @@ def lookuptype(x:bytes):
             if is_doc(x): return "doc"
             if is_xls(x): return "xls"
             if is_ppt(x): return "ppt"
-        elif is_tar(x):
-            return "tar"
-        elif is_lha(x):
-            return 'lha'
-        try:
-            if k in start:
-                return next(d for s, d in start[k] if x.startswith(s))
-            if k in match:
-                return next(d for f, d in match[k] if f(x))
-            return None
-        except StopIteration:
-            return None
-
-    if is_xml(x): return "xml"
-    if is_html(x): return "html"
-    if is_json(x): return "json"
-    if is_csv(x): return "csv"
-    if is_dml(x): return "dml"
+        else:
+            for name, sigs in offsets:
+                if all(x[i:i + len(s)] == s for i, s in sigs):
+                    return name
 
-    return "txt"
+        ret = longestprefix(x)
+        if ret is None and k in match:
+            ret = next((d for f, d in match[k] if f(x)), None)
+        return ret
+
+    return texttype(x, complete)
 
-def headtail(fp, buf):
+def headtail(fp, buf, tail=True):
+    """ head `buf` bytes and the last `buf` bytes after the head (a small file is not repeated) """
     ret = fp.read(buf)
+    if not tail or len(ret) < buf:
+        return ret
     try:
-        fp.seek(-1 * buf, 2)
+        pos = fp.tell()
+        fp.seek(max(fp.seek(0, 2) - buf, pos))
         ret += fp.read()
     except OSError:
         ret += fp.read()[-1 * buf:]
     return ret
 
-def guesstype(f):
-    buf = 65536
+class peekable(object):
+    """
+        binary file object wrapper which keeps the head bytes read through it.
+        sniffing a stream (compressed file, pipe) reads the head only once,
+        `seek` back into the head replays those bytes to the reader without rewinding the stream.
+    """
+    mode = "rb"
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.head = b""
+        self.pos = 0
+        self.fpos = 0
+        self.name = getattr(fp, "name", None)
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+    def _fpread(self, pos, n=-1, readline=False):
+        if self.fpos != pos:
+            self.fpos = self.fp.seek(pos)
+        ret = self.fp.readline(n) if readline else self.fp.read(n)
+        self.fpos += len(ret)
+        return ret
+
+    def peek(self, n):
+        """ Return: the first `n` bytes of the stream (without moving the position) """
+        while len(self.head) < n:
+            dat = self._fpread(len(self.head), n - len(self.head))
+            if not dat:
+                break
+            self.head += dat
+        return self.head[:n]
+
+    def read(self, n=-1):
+        head = self.head
+        if self.pos < len(head):
+            if n is None or n < 0:
+                ret = head[self.pos:] + self._fpread(len(head))
+            else:
+                ret = head[self.pos:self.pos + n]
+                if len(ret) < n:
+                    ret += self._fpread(len(head), n - len(ret))
+        else:
+            ret = self._fpread(self.pos, n)
+        self.pos += len(ret)
+        return ret
+
+    def read1(self, n=-1):
+        return self.read(n)
+
+    def readline(self, size=-1):
+        head = self.head
+        if self.pos < len(head):
+            i = head.find(b"\n", self.pos)
+            if i >= 0:
+                ret = head[self.pos:i + 1]
+            else:
+                ret = head[self.pos:]
+                if size is None or size < 0 or size > len(ret):
+                    ret += self._fpread(len(head), -1 if size is None or size < 0 else size - len(ret), readline=True)
+            if size is not None and 0 <= size < len(ret):
+                ret = ret[:size]
+        else:
+            ret = self._fpread(self.pos, size, readline=True)
+        self.pos += len(ret)
+        return ret
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        """ in the head without moving the stream, otherwise by the stream (compressed file reads through) """
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            self.fpos = offset = self.fp.seek(offset, 2)
+        self.pos = offset
+        return offset
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def isstream(f):
+    """ file object whose end is reachable only by reading through (compressed file, archive member, pipe) """
+    if isinstance(f, peekable) or f.__class__.__name__ in ["GzipFile", "BZ2File", "LZMAFile", "ZipExtFile"]:
+        return True
+    try:
+        return not f.seekable()
+    except AttributeError:
+        return False
+
+def readsample(f, buf=65536, tail=True):
+    """ head `buf` bytes and tail `buf` bytes (if `tail`) of a path, bytes or file object (the position is kept) """
     check = lambda *tp: isinstance(f, tp)
 
+    if check(peekable):
+        return f.peek(buf)
+
     if hasattr(f, "seek"):
         pos = f.tell()
 
@@ -323,18 +506,18 @@ def guesstype(f):
 
     if check(str) or hasattr(f, "joinpath"):
         with open(f, "rb") as fp:
-            ret = headtail(fp, buf)
+            ret = headtail(fp, buf, tail)
 
     elif check(BytesIO) or klass in ["ExFileObject", "ZipExtFile"]:
-        ret = headtail(f, buf)
+        ret = headtail(f, buf, tail)
 
     elif check(bytearray, bytes):
-        ret = f[:buf] + f[-1 * buf:]
+        ret = f[:buf] + f[buf:][-1 * buf:] if tail else f[:buf]
 
     elif check(StringIO):
         e = f.encoding
         f.seek(0)
-        ret = headtail(f, buf)
+        ret = headtail(f, buf, tail)
         if e:
             ret = ret.encode(e)
         else:
@@ -345,21 +528,254 @@ def guesstype(f):
         except AttributeError:
             m = f._mode
         if isinstance(m, int) or "b" in m:
-            ret = headtail(f, buf)
+            ret = headtail(f, buf, tail)
         else:
             with open(f.name, mode=m + "b") as fp:
-                ret = headtail(fp, buf)
+                ret = headtail(fp, buf, tail)
 
     if hasattr(f, "seek"):
         f.seek(pos)
 
+    return ret
+
+Sniff = namedtuple("Sniff", ["type", "encoding", "dialect", "lineterminator", "head"])
+
+def dialectparams(dialect):
+    """ csv.reader keyword arguments of a dialect (class), picklable and json serializable """
+    return dict(
+        delimiter=dialect.delimiter,
+        quotechar=dialect.quotechar,
+        doublequote=dialect.doublequote,
+        escapechar=dialect.escapechar,
+        skipinitialspace=dialect.skipinitialspace,
+        quoting=dialect.quoting,
+    )
+
+class sniffcache(object):
+    """
+        LRU cache of `sniff` results keyed by (device, inode, size, mtime_ns) of a path.
+        the head buffer is not cached (`head` of a hit is None).
+        with `path`, entries are also stored in a sqlite3 database and shared between processes and runs
+        (see `setsniffcache`), a locked database is skipped.
+    """
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.pid = None
+        self._con = None
+        if path:
+            self.connect()
+
+    def connect(self):
+        """ sqlite3 connection of this process (a forked worker opens its own) """
+        if self.pid != os.getpid():
+            import sqlite3
+            self.pid = os.getpid()
+            self._con = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            with self._con:
+                self._con.execute("""CREATE TABLE IF NOT EXISTS sniff (
+                    dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, value TEXT,
+                    PRIMARY KEY (dev, ino, size, mtime))""")
+        return self._con
+
+    @staticmethod
+    def key(path):
+        st = os.stat(path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def get(self, key, text=True):
+        """ Return: Sniff or None (`text` requires the text properties to be detected) """
+        value = self.entries.get(key)
+        if value is None and self.path:
+            from json import loads
+            from sqlite3 import OperationalError
+            try:
+                row = self.connect().execute("SELECT value FROM sniff WHERE dev = ? AND ino = ? AND size = ? AND mtime = ?", key).fetchone()
+            except OperationalError:
+                row = None
+            if row:
+                value = self.remember(key, tuple(loads(row[0])))
+
+        if value is not None and (value[-1] or not text):
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return Sniff(*value[:-1], None)
+        self.misses += 1
+        return None
+
+    def remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def put(self, key, sn, text=True):
+        value = self.remember(key, (*sn[:-1], text))
+        if self.path:
+            from json import dumps
+            from sqlite3 import OperationalError
+            try:
+                con = self.connect()
+                with con:
+                    con.execute("INSERT OR REPLACE INTO sniff VALUES (?, ?, ?, ?, ?)", (*key, dumps(value)))
+            except OperationalError:
+                pass
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+SNIFFCACHE = sniffcache()
+
+def setsniffcache(path=None, maxsize=4096):
+    """
+        replace `SNIFFCACHE` (the `--sniffcache` option of the command lines).
+        with `path`, the sniff results are also kept in a sqlite3 database shared between processes and runs.
+        Return: the new sniffcache
+    """
+    global SNIFFCACHE
+    SNIFFCACHE = sniffcache(maxsize, path)
+    return SNIFFCACHE
+
+def sniff(f, text=True, buf=65536, samplebyte=1024, cache=True, headonly=None):
+    """
+        file type and text properties of a file from one read of its head and tail.
+        the readers (`util.io.readrow` etc.) reuse the result instead of reading the head again.
+        results of paths are memoized in `SNIFFCACHE` while the file is unchanged.
+
+        Parameters:
+            f: path, bytes or file object
+            text: detect encoding, csv dialect and line terminator of a text (no NUL byte) file
+            samplebyte: sample size for text detection (extended to the end of the line)
+            cache: use `SNIFFCACHE` (None is disabled) for a path
+            headonly: sniff the head `buf` bytes only (default None is True for `isstream` objects,
+                      wrap a pipe in `peekable` to give the sniffed bytes back to the reader)
+        Return:
+            Sniff(type, encoding, dialect (csv.reader keyword arguments), lineterminator, head)
+    """
+    key = None
+    if cache and SNIFFCACHE is not None and (isinstance(f, str) or hasattr(f, "joinpath")):
+        try:
+            key = SNIFFCACHE.key(f)
+        except OSError:
+            pass
+        else:
+            ret = SNIFFCACHE.get(key, text)
+            if ret:
+                return ret
+
+    if headonly is None:
+        headonly = isstream(f)
+
+    ret = readsample(f, buf, not headonly)
     if not ret:
-        return "ZERO"
+        sn = Sniff("ZERO", None, None, None, b"")
+        if key:
+            SNIFFCACHE.put(key, sn, True)
+        return sn
 
-    _type = lookuptype(ret)
+    _type = lookuptype(ret, complete=not headonly or len(ret) < buf)
     if _type == "Microsoft Office 2003older":
-        return os.path.splitext(hasattr(f, "name") and f.name or f)[1][1:]
-    return _type
+        _type = os.path.splitext(hasattr(f, "name") and f.name or f)[1][1:]
+
+    head = ret[:buf]
+    encoding = dialect = lf = None
+
+    if text:
+        i = head.find(b"\n", samplebyte)
+        dat = head if i < 0 else head[:i + 1]
+        if not is_bin(dat):
+            from util.core import getencoding
+
+            encoding = getencoding(dat)
+            r = re.search(b"\r?\n|\r", dat)
+            lf = r and r.group(0).decode()
+            if _type == "csv":
+                try:
+                    dialect = dialectparams(csv.Sniffer().sniff(dat.decode(encoding or "utf-8")))
+                except (csv.Error, UnicodeDecodeError, LookupError):
+                    pass
+
+    sn = Sniff(_type, encoding, dialect, lf, head)
+    if key:
+        SNIFFCACHE.put(key, sn, text)
+    return sn
+
+def guesstype(f):
+    return sniff(f, text=False).type
+
+def samples(n=200, seed=0):
+    """ synthetic corpus of mixed file heads for `benchmark`. Return: list of (expected type, bytes) """
+    import gzip, zipfile, tarfile, json
+    from random import Random
+
+    rnd = Random(seed)
+    rows = [[str(i), "name{}".format(rnd.randrange(1000)), "{:.3f}".format(rnd.random())] for i in range(n * 20)]
+
+    def zipped(name):
+        bio = BytesIO()
+        with zipfile.ZipFile(bio, "w") as z:
+            z.writestr("[Content_Types].xml", "<Types/>")
+            z.writestr(name, "<x/>" * n)
+        return bio.getvalue()
+
+    tbio = BytesIO()
+    with tarfile.open(fileobj=tbio, mode="w") as t:
+        info = tarfile.TarInfo("a.txt")
+        info.size = 3
+        t.addfile(info, BytesIO(b"abc"))
+
+    return [
+        ("csv", "\r\n".join(map(",".join, rows)).encode()),
+        ("csv", "\n".join(map("\t".join, rows)).encode("cp932")),
+        ("json", json.dumps({"rows": rows}).encode()),
+        ("xml", b'<?xml version="1.0"?>\n<rows>' + b"".join(b"<r>%s</r>\n" % ",".join(r).encode() for r in rows) + b"</rows>"),
+        ("html", b"<!DOCTYPE html>\n<html><body>" + b"".join(b"<p>%s</p>\n" % " ".join(r).encode() for r in rows) + b"</body></html>"),
+        ("dml", b"record\n  string(',') a;\n  decimal(10) b;\nend;\n"),
+        ("txt", "\n".join(" ".join(rnd.sample(r, rnd.randrange(1, 4))) + "." for r in rows).encode()),
+        ("gz", gzip.compress(b"a,b\n" * n)),
+        ("zip", zipped("word.txt")),
+        ("xlsx", zipped("xl/workbook.xml")),
+        ("docx", zipped("word/document.xml")),
+        ("tar", tbio.getvalue()),
+        ("pdf", b"%PDF-1.4\n\x00" + bytes(rnd.randrange(256) for _ in range(n * 10))),
+        ("sqlite3", b"SQLite format 3\x00" + bytes(n * 10)),
+        ("accdb", b"\x00\x01\x00\x00Standard ACE DB\x00" + bytes(n * 10)),
+        ("wav", b"RIFF\x00\x00\x00\x00WAVE" + bytes(n * 10)),
+        (None, bytes(rnd.randrange(256) for _ in range(n * 10)).replace(b"\x00", b"\x01") + b"\x00"),
+    ]
+
+def benchmark(corpus=None, repeat=20, buf=65536, file=sys.stderr):
+    """
+        `lookuptype` time per sample of a corpus (default `samples()`, or paths of files)
+        Return: number of samples whose type differs from the expected type (None for paths)
+    """
+    from time import perf_counter
+
+    if corpus is None:
+        corpus = samples()
+    elif all(isinstance(x, (str, os.PathLike)) for x in corpus):
+        corpus = [(None, readsample(x, buf)) for x in corpus]
+
+    miss = 0
+    total = 0.0
+    print("{:<10}{:<10}{:>12}".format("expected", "type", "usec"), file=file)
+    for expected, dat in corpus:
+        x = dat[:buf] + dat[-buf:]
+        t = perf_counter()
+        for _ in range(repeat):
+            ret = lookuptype(x)
+        t = (perf_counter() - t) / repeat
+        total += t
+        if expected is not None and ret != expected:
+            miss += 1
+        print("{:<10}{:<10}{:>12.1f}".format(str(expected), str(ret), t * 1e6), file=file)
+    print("{:<20}{:>12.1f}".format("total", total * 1e6), file=file)
+    return miss
 
 def test():
     from util.core import tdir
@@ -371,6 +787,15 @@ def test():
         basename = os.path.basename(g)
         print(basename, guesstype(g), dt.now()-t)
 
+    assert(benchmark(repeat=1) == 0)
+    assert(longestprefix(b"\xff\xfe\x00\x00") == "Byte-order mark for text file encoded in little-endian 32-bit Unicode Transfer Format")
+    assert([texttype(x) for x in [b'{"a": [1]}', b"<!DOCTYPE html>\n<html></html>\n", b"a;b\n1;2\n"]] == ["json", "html", "csv"])
+    # json lines are not one json value
+    assert(sniff(b'{"a":1}\n{"a":2}\n').type == "txt")
+    assert(sniff(b'{"a":1}\r\n  {"a":2}').type == "txt")
+    assert(sniff(b'{"a": [{"b": 1},\n {"b": "}{"}]\n}\n').type == "json")
+    assert(not is_json(b'{"a":1}\n{"a":2}\n') and is_json(b'{\n "a": {"b": 1}\n}'))
+
 def main():
     import sys
     from glob import glob
@@ -387,9 +812,14 @@ def main():
          metavar="<files>",
          nargs="+",  default=[],
          help="text dump any files")
+    padd('--sniffcache', type=str, default=None,
+         help='sniff cache database path, keeps file types and csv dialects between runs (default None is in memory)')
 
     args = ps.parse_args()
 
+    if args.sniffcache:
+        setsniffcache(args.sniffcache)
+
     def walk(args):
         for arg in args.files:
             for f in glob(arg):
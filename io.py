@@ -16,6 +16,12 @@ __all__ = [
     "readrow",
     "dumper",
     "grouprow",
+    "csvrows",
+    "rangerows",
+    "maprows",
+    "countbytes",
+    "xlsxrows",
+    "byteranges",
     "unixlog",
     "getinfo",
     "getsize",
@@ -56,9 +62,11 @@ except ModuleNotFoundError:
     from xml.etree.ElementTree import Element
 
 from collections import namedtuple
-from functools import lru_cache
+from functools import lru_cache, partial
+from itertools import islice, chain
 from urllib.parse import quote_plus
 import struct
+import mmap
 from pickle import load as pkload
 
 class NotInstalledModuleError(Exception):
@@ -398,7 +406,7 @@ except:
     else:
         pyodbc = NotInstalledModuleError("Please Install command: pip3 install pyodbc")
 
-from util.filetype import guesstype
+from util.filetype import guesstype, sniff, setsniffcache, dialectparams, peekable, isstream
 from util.core import binopen, opener, getencoding, binchunk, globbing
 from util.utils import to_datetime, is1darray
 
@@ -612,37 +620,270 @@ def xmltodict(data:bytes, encoding=None, namespaces=False, nssep=':', comments=F
 
     return hl.item
 
-def _iterdecoder(fp, encoding=None, buffer=1024**2):
-    if encoding:
+def blocklines(fp, encoding=None, head=b"", size=None, blocksize=1 << 22, newline="\n"):
+    """
+        decoded lines (line ends kept) of a binary file object split only at `newline`.
+        bytes are decoded `blocksize` at a time by an incremental decoder,
+        a multibyte character across blocks is decoded in one piece.
+
+        Parameters:
+            fp: binary file object
+            encoding: text encoding (default utf-8)
+            head: bytes already read from `fp`, decoded first
+            size: bytes to read from `fp` (default None is to the end)
+            blocksize: bytes read at a time
+            newline: "\n" ("\r\n" too) or "\r"
+        Return:
+            generator of str
+    """
+    dec = codecs.getincrementaldecoder(encoding or "utf-8")()
+    remain = -1 if size is None else size
+    rest = ""
+    b = head
+    while True:
+        if b:
+            text = rest + dec.decode(b)
+            i = text.rfind(newline) + 1
+            rest = text[i:]
+            if i:
+                # split by hand, a StringIO with newline="\r" would translate a quoted "\n" to "\r"
+                lines = text[:i].split(newline)
+                lines.pop()
+                for x in lines:
+                    yield x + newline
+        if remain == 0:
+            break
+        b = fp.read(blocksize if remain < 0 else min(blocksize, remain))
+        if not b:
+            break
+        if remain > 0:
+            remain -= len(b)
+    rest += dec.decode(b"", True)
+    if rest:
+        yield rest
+
+def csvrows(path_or_buffer, sniffed=None, batchsize=1000, blocksize=1 << 22):
+    """
+        rows of a csv file in batches.
+        one csv.reader runs over `blocklines`, so a quoted field may contain any newline
+        and span blocks.
+
+        Parameters:
+            path_or_buffer: path or binary file object
+            sniffed: `util.filetype.sniff` result of the file
+            batchsize: rows per batch
+            blocksize: bytes read and decoded at a time
+        Return:
+            generator of list of rows
+    """
+    path, fp = pathbin(path_or_buffer)
+    try:
+        dat = fp.read(SAMPLEBYTE) + fp.readline()
+        e = sniffed and sniffed.encoding or getencoding(dat)
+        dialect = sniffed and sniffed.dialect or dialectparams(_csv.Sniffer().sniff(dat.decode(e or "utf-8", "ignore")))
+        # the first line end of the head, the head may run on to a quoted "\n" of a "\r" terminated file
+        lf = sniffed and sniffed.lineterminator
+        if not lf:
+            r = re.search("\r?\n|\r", dat.decode(e or "utf-8", "ignore"))
+            lf = r and r.group(0)
+        newline = "\r" if lf == "\r" else "\n"
+
+        reader = _csv.reader(blocklines(fp, e, dat, blocksize=blocksize, newline=newline), **dialect)
         while True:
-            buf = fp.read(buffer) + fp.readline()
-            if not buf:
+            rows = list(islice(reader, batchsize))
+            if not rows:
                 break
-            for line in buf.decode(encoding).splitlines():
-                yield line
-    else:
+            yield rows
+    finally:
+        if not hasattr(path_or_buffer, "close"):
+            fp.close()
+
+def splittable(encoding):
+    """ a file of `encoding` can be split at b"\\n" and its quotes counted bytewise (ascii compatible, stateless) """
+    try:
+        name = codecs.lookup(encoding or "utf-8").name
+    except LookupError:
+        return False
+    return "\n\r\"'".encode(name) == b"\n\r\"'" and not name.startswith(("iso2022", "hz", "utf-7"))
+
+def byteranges(path, n, start=0, quotechar=None, blocksize=1 << 22):
+    """
+        split a file into `n` byte ranges at record boundaries.
+        with `quotechar` (csv), a boundary is moved to the next newline outside of a quoted field.
+        the quote parity is counted from `start` in one scan of the file,
+        a stray quote in an unquoted field (or an escaped quote without doublequote) breaks it.
+        (the file must be `splittable`)
+
+        Parameters:
+            path: file path
+            n: number of ranges (fewer when the records are too large)
+            start: offset of the first record
+            quotechar: quote character of the csv dialect
+        Return:
+            list of (start, end)
+    """
+    size = os.path.getsize(path)
+    targets = iter([start + (size - start) * i // n for i in range(1, n)])
+    target = next(targets, None)
+    bounds = [start]
+
+    with open(path, "rb") as fp:
+        if not quotechar:
+            while target is not None:
+                fp.seek(target - 1)
+                fp.readline()
+                pos = fp.tell()
+                if pos >= size:
+                    break
+                bounds.append(pos)
+                target = next((x for x in targets if x > pos), None)
+        else:
+            q = quotechar.encode()
+            fp.seek(start)
+            off, odd = start, 0
+            while target is not None:
+                b = fp.read(blocksize)
+                if not b:
+                    break
+                i = 0
+                while target is not None:
+                    t = target - off
+                    if t >= len(b):
+                        odd ^= b.count(q, i) & 1
+                        break
+                    if t > i:
+                        odd ^= b.count(q, i, t) & 1
+                        i = t
+                    j = b.find(b"\n", i)
+                    if j < 0:
+                        odd ^= b.count(q, i) & 1
+                        target = off + len(b)
+                        break
+                    odd ^= b.count(q, i, j) & 1
+                    i = j + 1
+                    pos = off + i
+                    if odd:
+                        target = pos
+                    elif pos >= size:
+                        target = None
+                    else:
+                        bounds.append(pos)
+                        target = next((x for x in targets if x > pos), None)
+                off += len(b)
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _readrange(job):
+    """ rows of a byte range, or `func` of them (for the process pool of `maprows`) """
+    func, path, start, end, encoding, dialect = job
+    with open(path, "rb") as fp:
+        fp.seek(start)
+        if dialect is None:
+            rows = [line.rstrip() for line in fp.read(end - start).decode(encoding or "utf-8").splitlines()]
+        else:
+            rows = list(_csv.reader(blocklines(fp, encoding, size=end - start), **dialect))
+    return rows if func is None else func(rows)
+
+def maprows(func, path_or_buffer, jobs=None, ordered=True, sniffed=None, chunksize=1 << 23, window=None):
+    """
+        `func` of the rows of a large csv or txt file, parsed in parallel.
+        the file is split into `byteranges` of about `chunksize` bytes,
+        each range is parsed in a process pool with the encoding and dialect sniffed once,
+        and `func` is applied to its rows in the worker.
+        returning rows to the parent costs more than parsing them,
+        so reduce them in `func` (count, profile, encode ...) where possible.
+        buffers, other file types, small files and not `splittable` encodings are read by `readrow`
+        and `func` is applied to consecutive lists of its values.
+
+        Parameters:
+            func: picklable function of a list of rows (None is the rows)
+            path_or_buffer: path or binary file object
+            jobs: worker number (default cpu count, `1` is `readrow`)
+            ordered: False yields the result of each range as soon as it is parsed
+            sniffed: `util.filetype.sniff` result of the file
+            chunksize: bytes of a range
+            window: max ranges parsed ahead (see `util.utils.pmap`)
+        Return:
+            generator of `func` results in file order
+    """
+    from util.utils import pmap
+
+    sn = None
+    if isinstance(path_or_buffer, (str, os.PathLike)) and jobs != 1:
+        path = os.fspath(path_or_buffer)
+        sn = sniffed or sniff(path)
+        size = os.path.getsize(path)
+        if sn.type not in readrow._sniffed or not splittable(sn.encoding) or size <= chunksize:
+            sn = None
+
+    if sn is None:
+        it = (x.value for x in readrow(path_or_buffer))
         while True:
-            buf = fp.read(buffer) + fp.readline()
-            if not buf:
+            rows = list(islice(it, 1 << 14))
+            if not rows:
                 break
-            for line in buf.decode().splitlines():
-                yield line
+            yield rows if func is None else func(rows)
+        return
+
+    dialect = quotechar = None
+    if sn.type == "csv":
+        dialect = sn.dialect
+        if not dialect:
+            with open(path, "rb") as fp:
+                dialect = dialectparams(_csv.Sniffer().sniff(fp.read(SAMPLEBYTE).decode(sn.encoding or "utf-8", "ignore")))
+        if dialect.get("quoting") != _csv.QUOTE_NONE:
+            quotechar = dialect.get("quotechar")
+
+    ranges = byteranges(path, -(-size // chunksize), 0, quotechar)
+    jobargs = ((func, path, s, e, sn.encoding, dialect) for s, e in ranges)
+    yield from pmap(_readrange, jobargs, jobs, ordered=ordered, window=window)
+
+def rangerows(path_or_buffer, jobs=None, ordered=True, sniffed=None, chunksize=1 << 23, window=None):
+    """
+        rows of a large csv or txt file parsed in parallel (see `maprows`).
+        Return:
+            generator of pinfo(path, None, row)
+    """
+    path = os.fspath(path_or_buffer) if isinstance(path_or_buffer, (str, os.PathLike)) else getattr(path_or_buffer, "name", None)
+    for rows in maprows(None, path_or_buffer, jobs, ordered, sniffed, chunksize, window):
+        for row in rows:
+            yield pinfo(path, None, row)
+
+def xlsxrows(path_or_buffer, targets=[]):
+    """
+        rows of each worksheet streamed by openpyxl read_only mode (memory is O(row), not O(workbook)).
+        sheets not in `targets` are skipped without being parsed.
+        Return: generator of (sheetname, generator of row tuple)
+    """
+    wb = openpyxl.load_workbook(path_or_buffer, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            if not targets or ws.title in targets:
+                yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
 
 pinfo = namedtuple("LazyReader", ["path", "target", "value"])
 class readrow:
+    _sniffed = {"csv", "txt"}
+
     @classmethod
     def handler(cls, path_or_buffer):
-        fp = binopen(path_or_buffer)
-        funcstr = guesstype(fp)
+        sn = sniff(path_or_buffer)
+        funcstr = sn.type
 
         if funcstr is None:
-            raise NotImplementedError("Unknown binary data `{}`".format(fp))
+            raise NotImplementedError("Unknown binary data `{}`".format(path_or_buffer))
         try:
-            return getattr(cls, funcstr)
+            func = getattr(cls, funcstr)
         except AttributeError:
             raise NotImplementedError("{} class is not function `{}`".format(cls.__name__, funcstr))
+        return partial(func, sniffed=sn) if funcstr in cls._sniffed else func
 
     def __new__(cls, path_or_buffer, *args, **kw):
+        if isstream(path_or_buffer) and not isinstance(path_or_buffer, peekable):
+            path_or_buffer = peekable(path_or_buffer)
         return cls.handler(path_or_buffer)(path_or_buffer, *args, **kw)
 
     @staticmethod
@@ -701,7 +942,7 @@ class readrow:
             fp.close()
 
     @staticmethod
-    def xlsx(path_or_buffer):
+    def xlsx(path_or_buffer, targets=[]):
         path, fp = pathbin(path_or_buffer)
 
 #         with xlrd.open_workbook(file_contents=fp.read()) as wb:
@@ -710,12 +951,9 @@ class readrow:
 #                 for i in range(sh.nrows):
 #                     yield pinfo(path, sname, sh.row_values(i))
 
-        wb = openpyxl.load_workbook(fp)
-        for sh in wb.worksheets:
-            sname = sh.title
-
-            for row in sh.rows:
-                yield pinfo(path, sname, [r.value for r in row])
+        for sname, rows in xlsxrows(fp, targets):
+            for row in rows:
+                yield pinfo(path, sname, list(row))
 
         if not hasattr(path_or_buffer, "close"):
             fp.close()
@@ -746,20 +984,12 @@ class readrow:
             fp.close()
 
     @staticmethod
-    def csv(path_or_buffer):
+    def csv(path_or_buffer, sniffed=None):
         path, fp = pathbin(path_or_buffer)
-        dat = fp.read(SAMPLEBYTE) + fp.readline()
-
-        e = getencoding(dat)
-        txt = dat.decode(e)
-        dialect = _csv.Sniffer().sniff(txt)
 
-        for row in _csv.reader(StringIO(txt), dialect=dialect):
-            yield pinfo(path, None, row)
-
-        it = _iterdecoder(fp, e)
-        for row in _csv.reader(it, dialect=dialect):
-            yield pinfo(path, None, row)
+        for rows in csvrows(fp, sniffed):
+            for row in rows:
+                yield pinfo(path, None, row)
 
         if not hasattr(path_or_buffer, "close"):
             fp.close()
@@ -808,11 +1038,10 @@ class readrow:
             yield pinfo(path, x, attr)
 
     @staticmethod
-    def txt(path_or_buffer):
+    def txt(path_or_buffer, sniffed=None):
         path, fp = pathbin(path_or_buffer)
-        dat = fp.read(SAMPLEBYTE)
+        encoding = sniffed.encoding if sniffed else getencoding(fp.read(SAMPLEBYTE))
         fp.close()
-        encoding = getencoding(dat)
         with codecs.open(path, encoding=encoding) as f:
             for line in f:
                 yield pinfo(path, None, line.rstrip())
@@ -831,7 +1060,7 @@ class readrow:
                     continue
                 target = info.filename.encode("cp437").decode("cp932")
                 if target in targets:
-                    fp = f.open(info)
+                    fp = peekable(f.open(info))
                     func = __class__.handler(fp)
                     fp.seek(0)
                     for row in func(fp):
@@ -845,6 +1074,7 @@ class readrow:
         path, fp = pathbin(path_or_buffer)
         target = path.stem
         with GzipFile(fileobj=fp) as f:
+            f = peekable(f)
             func = __class__.handler(f)
             f.seek(0)
             for row in func(f):
@@ -858,6 +1088,7 @@ class readrow:
         path, fp = pathbin(path_or_buffer)
         target = path.stem
         with BZ2File(fp) as f:
+            f = peekable(f)
             func = __class__.handler(f)
             f.seek(0)
             for row in func(f):
@@ -870,6 +1101,7 @@ class readrow:
         path, fp = pathbin(path_or_buffer)
         target = path.stem
         with LZMAFile(fp) as f:
+            f = peekable(f)
             func = __class__.handler(f)
             f.seek(0)
             for row in func(f):
@@ -890,7 +1122,7 @@ class readrow:
                 target = info.name
 
                 if target in targets:
-                    fp = f.extractfile(info)
+                    fp = peekable(f.extractfile(info))
                     func = __class__.handler(fp)
                     fp.seek(0)
                     for row in func(fp):
@@ -932,7 +1164,7 @@ class readrow:
                     continue
                 target = info.filename
                 if target in targets:
-                    fp = f.open(info)
+                    fp = peekable(f.open(info))
                     func = __class__.handler(fp)
                     fp.seek(0)
                     for row in func(fp):
@@ -1289,12 +1521,11 @@ class grouprow(readrow):
             fp.close()
 
     @staticmethod
-    def xlsx(path_or_buffer):
+    def xlsx(path_or_buffer, targets=[]):
         path, fp = pathbin(path_or_buffer)
 
-        with xlrd.open_workbook(file_contents=fp.read()) as wb:
-            for sh in wb.sheets():
-                yield pinfo(path, sh.name, [sh.row_values(i) for i in range(sh.nrows)])
+        for sname, rows in xlsxrows(fp, targets):
+            yield pinfo(path, sname, [list(row) for row in rows])
 
         if not hasattr(path_or_buffer, "close"):
             fp.close()
@@ -1325,28 +1556,19 @@ class grouprow(readrow):
             fp.close()
 
     @staticmethod
-    def csv(path_or_buffer):
+    def csv(path_or_buffer, sniffed=None):
         path, fp = pathbin(path_or_buffer)
-        dat = fp.read(SAMPLEBYTE) + fp.readline()
 
-        e = getencoding(dat)
-        txt = dat.decode(e)
-        dialect = _csv.Sniffer().sniff(txt)
-
-        tmp = list(_csv.reader(StringIO(txt), dialect=dialect))
-
-        it = _iterdecoder(fp, e)
-        yield pinfo(path, None, tmp + list(_csv.reader(it, dialect=dialect)))
+        yield pinfo(path, None, [row for rows in csvrows(fp, sniffed) for row in rows])
 
         if not hasattr(path_or_buffer, "close"):
             fp.close()
 
     @staticmethod
-    def txt(path_or_buffer):
+    def txt(path_or_buffer, sniffed=None):
         path, fp = pathbin(path_or_buffer)
-        dat = fp.read(SAMPLEBYTE)
+        encoding = sniffed.encoding if sniffed else getencoding(fp.read(SAMPLEBYTE))
         fp.close()
-        encoding = getencoding(dat)
         with codecs.open(path, encoding=encoding) as f:
             yield pinfo(path, None, f.readlines())
 
@@ -1639,28 +1861,30 @@ class getinfo:
 
     @classmethod
     def handler(cls, path_or_buffer):
-        fp = binopen(path_or_buffer)
-        func = guesstype(fp)
+        sn = sniff(path_or_buffer)
+        func = sn.type
         if func is None:
             return cls.binaryfile
         elif func in [fc for fc in dir(cls) if not fc.startswith("_")]:
             return getattr(cls, func)
         else:
-            return cls.flatfile
+            return partial(cls.flatfile, sniffed=sn)
 
     def __new__(cls, path_or_buffer, *args, **kw):
         return cls.handler(path_or_buffer)(path_or_buffer, *args, **kw)
 
     @staticmethod
-    def flatfile(path_or_buffer):
+    def flatfile(path_or_buffer, sniffed=None):
         path, fp = pathbin(path_or_buffer)
-        dat = fp.read(SAMPLEBYTE) + fp.readline()
+        if sniffed:
+            e, lf = sniffed.encoding, sniffed.lineterminator
+        else:
+            dat = fp.read(SAMPLEBYTE) + fp.readline()
+            e = getencoding(dat)
+            lf = getLF(dat)
 
         if not hasattr(path_or_buffer, "close"):
             fp.close()
-
-        e = getencoding(dat)
-        lf = getLF(dat)
         if hasattr(fp, "stat"):
             stat = fp.stat.copy()
             stat[6] = e
@@ -2101,6 +2325,94 @@ class DBgrouprow(DBrow):
                 rows = map(list, con.execute("SELECT * FROM "+ table))
                 yield pinfo(server, schema_table, list(rows))
 
+_decompressors = dict(gz=GzipFile, bz2=BZ2File, xz=LZMAFile)
+
+def _safecut(b, word, p, lo=0):
+    """ the nearest position in [lo, p] no occurrence of `word` in `b` spans (a count of `b` can be split at it) """
+    w = len(word) - 1
+    while p > lo:
+        j = b.find(word, max(p - w, lo), p + w)
+        if j < 0 or j >= p:
+            return p
+        p = j
+    return lo
+
+def _countstream(fp, word, blocksize):
+    """ occurrences of `word` in a binary stream, read `blocksize` at a time """
+    n, tail = 0, b""
+    while True:
+        b = fp.read(blocksize)
+        if not b:
+            return n + tail.count(word)
+        b = tail + b
+        p = _safecut(b, word, len(b) - len(word) + 1)
+        n += b.count(word, 0, p)
+        tail = b[p:]
+
+def _countsegment(job):
+    """ occurrences of `word` in [start, end) of a file (for the pool of `countbytes`) """
+    path, word, start, end, blocksize = job
+    n, i = 0, start
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while i < end:
+            p = min(i + blocksize, end)
+            if p < end:
+                p = _safecut(mm, word, p, i)
+                if p == i:
+                    p = end
+            n += mm[i:p].count(word)
+            i = p
+    return n
+
+def countbytes(path, word, jobs=None, blocksize=1 << 24, executor=None):
+    """
+        occurrences (not overlapping) of `word` bytes in a file.
+        the file is memory mapped and split into segments counted in parallel by `util.utils.pmap`.
+        segments are cut where no match spans, so the count equals `bytes.count` of the whole file.
+        (`bytes.count` holds the GIL, threads by `executor` do not scale on a GIL build)
+        gz, bz2 and xz files are counted in the decompressed stream.
+
+        Parameters:
+            path: file path
+            word: bytes
+            jobs: worker number (default cpu count, `1` is in process)
+            blocksize: bytes counted at a time (a segment is at least 4 blocks)
+            executor: concurrent.futures executor class (default ProcessPoolExecutor)
+        Return:
+            int
+    """
+    from util.utils import pmap
+
+    path = os.fspath(path)
+    if not word:
+        raise ValueError("empty word")
+
+    ftype = guesstype(path)
+    if ftype in _decompressors:
+        with _decompressors[ftype](path) as fp:
+            return _countstream(fp, word, blocksize)
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+
+    jobs = jobs or os.cpu_count() or 1
+    n = min(jobs, size // (blocksize * 4)) or 1
+
+    bounds = [0]
+    if n > 1:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(1, n):
+                p = _safecut(mm, word, size * i // n, bounds[-1])
+                if p > bounds[-1]:
+                    bounds.append(p)
+    bounds.append(size)
+    jobargs = [(path, word, s, e, blocksize) for s, e in zip(bounds[:-1], bounds[1:])]
+    n = len(jobargs)
+    if n == 1:
+        return _countsegment(jobargs[0])
+    return sum(pmap(_countsegment, jobargs, n, ordered=False, executor=executor))
+
 class Path(type(pathlib.Path())):
 
     __slots__ = (
@@ -2170,7 +2482,7 @@ class Path(type(pathlib.Path())):
 
     @property
     def encoding(self):
-        return getencoding(self.read_bytes(SAMPLEBYTE))
+        return sniff(self).encoding
 
     @property
     def ext(self):
@@ -2178,7 +2490,7 @@ class Path(type(pathlib.Path())):
 
     @property
     def lineterminator(self):
-        return getLF(self.read_bytes(SAMPLEBYTE))
+        return sniff(self).lineterminator
 
     @property
     def owner(self):
@@ -2208,33 +2520,19 @@ class Path(type(pathlib.Path())):
     def size(self):
         return self.info.size
 
-    def wordcount(self, word, buf_size = 1024 ** 2):
-        with open(self.__str__(), mode="rb") as f:
-            read_f = f.read # loop optimization
-            if isinstance(word, str):
-                if self.encoding:
-                    word = word.encode(self.encoding)
-                else:
-                    word = word.encode()
-            elif isinstance(word, (int, float)):
-                word = bytes(str(word))
-
-            pos = f.tell()
-            if pos != 0:
-                f.seek(0)
-
-            buf = read_f(buf_size)
+    def wordcount(self, word, buf_size = 1 << 24, jobs = None):
+        if isinstance(word, str):
+            if self.encoding:
+                word = word.encode(self.encoding)
+            else:
+                word = word.encode()
+        elif isinstance(word, (int, float)):
+            word = str(word).encode()
 
-            words = 0
-            while buf:
-                words += buf.count(word)
-                buf = read_f(buf_size)
+        return countbytes(self.__str__(), word, jobs, buf_size)
 
-            f.seek(pos)
-            return words
-
-    def linecount(self, buf_size = 1024 ** 2):
-        return self.wordcount(word=b"\n", buf_size = buf_size)
+    def linecount(self, buf_size = 1 << 24, jobs = None):
+        return self.wordcount(word=b"\n", buf_size = buf_size, jobs = jobs)
 
     def uncompressedsize(self):
         size = getsize(self.__str__())
@@ -2243,9 +2541,7 @@ class Path(type(pathlib.Path())):
         return size
 
     def guesstype(self):
-        if self._type is None:
-            self._type = guesstype(self.__str__())
-        return self._type
+        return guesstype(self.__str__())
 
     def tree_file(self, recursive:bool=True, dotfile:bool=False):
         if dotfile:
@@ -2296,8 +2592,7 @@ class Path(type(pathlib.Path())):
             return MSWordOLE(binopen(path_or_buffer), *args, **kw)
 
         def xlsx(path_or_buffer, *args, **kw):
-            with binopen(path_or_buffer) as fp:
-                return xlrd.open_workbook(file_contents=fp.read(), *args, **kw)
+            return openpyxl.load_workbook(binopen(path_or_buffer), *args, **dict(dict(read_only=True), **kw))
 
         xls = xlsx
 
@@ -2310,13 +2605,16 @@ class Path(type(pathlib.Path())):
             return doc
 
         def csv(path_or_buffer, *args, **kw):
-            with binopen(path_or_buffer) as fp:
-                dat = fp.read(SAMPLEBYTE) + fp.readline()
-                e = getencoding(dat)
-                txt = dat.decode(e)
-                dialect = _csv.Sniffer().sniff(txt)
+            sn = sniff(path_or_buffer)
+            e = sn.encoding
+            dialect = sn.dialect
+            if not (e and dialect):
+                with binopen(path_or_buffer) as fp:
+                    dat = fp.read(SAMPLEBYTE) + fp.readline()
+                    e = e or getencoding(dat)
+                    dialect = dialect or dialectparams(_csv.Sniffer().sniff(dat.decode(e)))
 
-            return _csv.reader(opener(path_or_buffer, encoding=e), dialect=dialect, *args, **kw)
+            return _csv.reader(opener(path_or_buffer, encoding=e), *args, **dict(dialect, **kw))
 
         def dml(path_or_buffer, excludes = ["^;?\n", "^;$", "^\s*//.*$"], lvsep = "  "):
             with binopen(path_or_buffer) as fp:
@@ -2600,6 +2898,196 @@ def test():
             except Exception as e:
                 print(" ERROR", e)
 
+    def test_sniffed():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.csv")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write("a;b\r\n1;あ\r\n2;い\r\n")
+            sn = sniff(path)
+            assert((sn.type, sn.encoding, sn.dialect["delimiter"], sn.lineterminator) == ("csv", "utf-8", ";", "\r\n"))
+            assert([x.value for x in readrow(path)] == [["a", "b"], ["1", "あ"], ["2", "い"]])
+            assert([x.value for x in readrow.csv(path)] == [x.value for x in readrow(path)])
+            assert(getinfo(path)[6:8] == ("utf-8", "\r\n"))
+
+            from util.filetype import sniffcache
+            cache = sniffcache(path=os.path.join(d, "sniff.sqlite3"))
+            key = cache.key(path)
+            assert(cache.get(key) is None)
+            cache.put(key, sn)
+            assert(cache.get(key, text=False) == sn._replace(head=None))
+            assert(sniffcache(path=cache.path).get(key) == sn._replace(head=None))
+            assert((cache.hits, cache.misses) == (1, 1))
+            with open(path, "a", encoding="utf-8", newline="") as f:
+                f.write("3;う\r\n")
+            assert(cache.get(cache.key(path)) is None)
+
+            # the `--sniffcache` option: sniff results of a run are read by the next one
+            from util import filetype
+            default = filetype.SNIFFCACHE
+            try:
+                setsniffcache(os.path.join(d, "cli.sqlite3"))
+                sn = sniff(path)
+                assert(filetype.SNIFFCACHE.path.endswith("cli.sqlite3"))
+                assert(setsniffcache(os.path.join(d, "cli.sqlite3")).get(cache.key(path)) == sn._replace(head=None))
+            finally:
+                filetype.SNIFFCACHE = default
+
+    def test_stream():
+        import gzip
+        from tempfile import TemporaryDirectory
+        from util.filetype import isstream
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.csv.gz")
+            rows = [[str(i), "x" * (i % 7)] for i in range(20000)]
+            with gzip.open(path, "wt", newline="") as f:
+                _csv.writer(f).writerows(rows)
+            with gzip.open(path) as f:
+                assert(isstream(f))
+                p = peekable(f)
+                assert(sniff(p).type == "csv" and p.tell() == 0 and len(p.head) == 65536)
+                assert([x.value for x in readrow.csv(p)] == rows)
+            assert([x.value.value for x in readrow(path)] == rows)
+
+    def test_csvrows():
+        from tempfile import TemporaryDirectory
+        from util.filetype import Sniff
+        rows = [["id", "v"]] + [[str(i), "x" * 100 + "\r\n\u3042\ry\"z\x0bw" if i % 3 == 0 else "\u3042" * i] for i in range(1, 50)]
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "q.csv")
+            for enc in ["utf-8", "cp932", "utf-16"]:
+                with open(path, "w", encoding=enc, newline="") as f:
+                    _csv.writer(f).writerows(rows)
+                sn = Sniff("csv", enc, dict(delimiter=","), "\r\n", None)
+                for blocksize in [7, 1 << 22]:
+                    batches = list(csvrows(path, sn, batchsize=8, blocksize=blocksize))
+                    assert([len(x) for x in batches] == [8] * 6 + [2])
+                    assert([r for x in batches for r in x] == rows)
+                assert([x.value for x in readrow.csv(path, sn)] == rows)
+                assert(next(grouprow.csv(path, sn)).value == rows)
+            with open(path, "wb") as f:
+                f.write(b"a,b\r1,\"x\ry\"\r")
+            assert([r for x in csvrows(path) for r in x] == [["a", "b"], ["1", "x\ry"]])
+
+            # a quoted "\n" in a "\r" terminated file (past the sniffed head) is kept as is
+            assert(list(blocklines(BytesIO(b'a,"x\ny"\rb,c\r'), blocksize=3, newline="\r")) == ['a,"x\ny"\r', 'b,c\r'])
+            rows = [["id", "v"]] + [[str(i), "a\nb" if i == 500 else "c"] for i in range(1000)]
+            with open(path, "w", newline="") as f:
+                _csv.writer(f, lineterminator="\r", quoting=_csv.QUOTE_ALL).writerows(rows)
+            for blocksize in [5, 1 << 22]:
+                assert([r for x in csvrows(path, blocksize=blocksize) for r in x] == rows)
+
+    def test_byteranges():
+        from tempfile import TemporaryDirectory
+        from random import Random
+        rnd = Random(1)
+        rows = [["id", "v"]] + [[str(i), "".join(rnd.choice('ab"\n\r,\u3042 ') for _ in range(rnd.randrange(30)))] for i in range(3000)]
+        dialect = dict(delimiter=",", quotechar='"', doublequote=True, escapechar=None, skipinitialspace=False, quoting=_csv.QUOTE_MINIMAL)
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "r.csv")
+            for enc in ["utf-8", "cp932"]:
+                with open(path, "w", encoding=enc, newline="") as f:
+                    _csv.writer(f).writerows(rows)
+                for n in [1, 7, 100]:
+                    ranges = byteranges(path, n, 0, '"', blocksize=16)
+                    assert(len(ranges) == n and ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(path))
+                    assert([r for s, e in ranges for r in _readrange((None, path, s, e, enc, dialect))] == rows)
+            assert(splittable("cp932") and not splittable("utf-16") and not splittable("iso2022_jp"))
+
+            assert([x.value for x in rangerows(path, 2, chunksize=4096)] == [x.value for x in readrow(path)])
+            assert(sum(maprows(len, path, 2, ordered=False, chunksize=4096)) == len(rows))
+            assert(sum(maprows(len, path, 1)) == len(rows))
+
+    def test_countbytes():
+        from tempfile import TemporaryDirectory
+        from random import Random
+        rnd = Random(0)
+        with TemporaryDirectory() as d:
+            for data in [bytes(rnd.choice(b"ab\n") for _ in range(20000)), b"a" * 501 + b"b" + b"a" * 300]:
+                path = os.path.join(d, "c.txt")
+                with open(path, "wb") as f:
+                    f.write(data)
+                with GzipFile(path + ".gz", "wb") as f:
+                    f.write(data)
+                for word in [b"\n", b"ab", b"aa", b"aba", b"a\nb"]:
+                    for blocksize in [7, 1 << 24]:
+                        assert(countbytes(path, word, 1, blocksize) == data.count(word))
+                        assert(countbytes(path + ".gz", word, 1, blocksize) == data.count(word))
+                    assert(countbytes(path, word, 3, 7) == data.count(word))
+            assert(Path(path).linecount() == 0 and Path(path).wordcount("aa") == data.count(b"aa"))
+
+    def test_xlsxrows():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.xlsx")
+            wb = openpyxl.Workbook()
+            wb.active.title = "s1"
+            wb.active["B2"] = 1
+            wb.create_sheet("s2").append(["x", None, 2])
+            wb.save(path)
+
+            assert([(x.target, x.value) for x in readrow(path)] == [("s1", [None, None]), ("s1", [None, 1]), ("s2", ["x", None, 2])])
+            assert([(x.target, x.value) for x in readrow.xlsx(path, ["s2"])] == [("s2", ["x", None, 2])])
+            assert([(x.target, x.value) for x in grouprow.xlsx(path, ["s1"])] == [("s1", [[None, None], [None, 1]])])
+            assert([s for s, rows in xlsxrows(path, ["s2"])] == ["s2"])
+            wb = Path(path).open()
+            assert(wb.read_only and wb.sheetnames == ["s1", "s2"])
+            wb.close()
+
+    def test_dumplines():
+        from tempfile import TemporaryDirectory
+        from util.utils import pmap
+        with TemporaryDirectory() as d:
+            files = []
+            for i in range(4):
+                files.append(os.path.join(d, "{}.csv".format(i)))
+                with open(files[-1], "w", newline="") as f:
+                    _csv.writer(f).writerows([["id", "v"]] + [[j, "a\nb" * i] for j in range(100 * i + 1)])
+            kw = dict(encoding="utf-8", sep=",", lineterminator="\n", filename=False, target=False)
+            serial = [b"".join(dumplines(f, **kw)) for f in files]
+            assert(serial[0].startswith(b"id,v\n0,"))
+            def unspool(spool):
+                out = []
+                _unspool(spool, out.append, blocksize=64)
+                return b"".join(out)
+
+            assert([unspool(_dumpfile((f, kw, d), buffering=64)) for f in files] == serial)
+            assert([unspool(x) for x in pmap(_dumpfile, ((f, kw, d) for f in files), 2)] == serial)
+            assert(sorted(unspool(x) for x in pmap(_dumpfile, ((f, kw, d) for f in files), 2, ordered=False)) == sorted(serial))
+            assert(not [x for x in os.listdir(d) if x.endswith(".dump")])
+
+    def test_main_row_jobs():
+        import openpyxl
+        from io import TextIOWrapper
+        from tempfile import TemporaryDirectory
+
+        def dump(args):
+            stdout, argv = sys.stdout, sys.argv
+            sys.stdout = TextIOWrapper(BytesIO())
+            sys.argv = ["dumper"] + args
+            try:
+                main_row()
+                sys.stdout.flush()
+                return sys.stdout.buffer.getvalue()
+            finally:
+                sys.stdout, sys.argv = stdout, argv
+
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "book.xlsx")
+            wb = openpyxl.Workbook()
+            wb.active.title = "sales"
+            wb.active.append(["id", "v"])
+            wb.create_sheet("stock").append([1, "x"])
+            wb.save(path)
+            serial = dump(["-t", "-f", path])
+            assert(b"[sales]" in serial and b"[stock]" in serial)
+            assert(dump(["-t", "-f", "-j", "2", path]) == serial)
+
+            path = os.path.join(d, "a.csv")
+            with open(path, "w", newline="") as f:
+                _csv.writer(f).writerows([[i, "a\nb"] for i in range(100)])
+            assert(dump(["-t", "-f", "-j", "2", path]) == dump(["-t", "-f", path]))
+
     def test_getsize():
         for g in glob(tdir+"*.*"):
             n = os.path.basename(g)
@@ -2683,8 +3171,62 @@ def walk(args):
 def unicode_escape(x):
     return x.encode().decode("unicode_escape")
 
+def _oneliner(b:str):
+    if b is None:
+        return ""
+    elif isinstance(b, str):
+        if "\r" in b:
+            b = b.replace("\r", "\\r")
+        if "\n" in b:
+            b = b.replace("\n", "\\n")
+        return b
+    else:
+        return str(b)
+
+def dumplines(f, encoding="cp932", sep="\t", lineterminator="\r\n", filename=False, target=False, rows=None):
+    """ encoded output lines of `main_row` for a file (or `rows` pinfo of it) """
+    for x in readrow(f) if rows is None else rows:
+        if filename:
+            yield "{}:{}".format(x.path, sep).encode(encoding, errors="backslashreplace")
+        if target:
+            yield "[{}]{}".format(x.target, sep).encode(encoding, errors="backslashreplace")
+        try:
+            yield (x.value + lineterminator).encode(encoding, errors="backslashreplace")
+        except TypeError:
+            yield (sep.join(map(_oneliner,x.value)) + lineterminator).encode(encoding, errors="backslashreplace")
+
+def _dumpfile(job, buffering=1024 ** 2):
+    """
+        output of a file spooled to a temporary file in `tmpdir` (for the process pool of `main_row`),
+        so that a worker holds only the write buffer of a file.
+        Return: spool file path (see `_unspool`)
+    """
+    from tempfile import mkstemp
+
+    f, kw, tmpdir = job
+    fd, spool = mkstemp(suffix=".dump", dir=tmpdir)
+    with open(fd, "wb", buffering=buffering) as fp:
+        for b in dumplines(f, **kw):
+            fp.write(b)
+    return spool
+
+def _unspool(spool, write, blocksize=1024 ** 2):
+    """ write the contents of a spool file of `_dumpfile` and remove it """
+    try:
+        with open(spool, "rb") as fp:
+            for b in iter(partial(fp.read, blocksize), b""):
+                write(b)
+    finally:
+        os.remove(spool)
+
+def _dumprange(rows, f, kw):
+    """ output of the rows of a byte range (for `maprows` of `main_row`) """
+    return b"".join(dumplines(f, rows=(pinfo(f, None, r) for r in rows), **kw))
+
 def main_row():
     from argparse import ArgumentParser
+    from tempfile import TemporaryDirectory
+    from util.utils import pmap
 
     ps = ArgumentParser(prog="dumper",
                         description="any file text dump\n")
@@ -2708,39 +3250,50 @@ def main_row():
          help='filename print (default False)')
     padd('-t', '--target', action='store_true', default=False,
          help='targetname print (default False)')
+    padd('-j', '--jobs', type=int, default=1,
+         help='parallel process number of files, or byte ranges of a single csv/txt file (default `1`, `0` is cpu count)')
+    padd('-w', '--window', type=int, default=None,
+         help='max files (or ranges) parsed ahead of the output with `-j` (default `jobs * 2`)')
+    padd('--unordered', action='store_true', default=False,
+         help='with `-j`, output each file (or range) as soon as it is parsed (default False is input order)')
+    padd('--sniffcache', type=str, default=None,
+         help='sniff cache database path, keeps file types and csv dialects between runs (default None is in memory)')
     args = ps.parse_args()
 
-    encoding = args.encoding
-    lineterminator = args.lineterminator
-    sep = args.sep
-    target = args.target
-    filename = args.filename
+    if args.sniffcache:
+        setsniffcache(args.sniffcache)
+
+    kw = dict(
+        encoding=args.encoding,
+        sep=args.sep,
+        lineterminator=args.lineterminator,
+        filename=args.filename,
+        target=args.target,
+    )
 
     i = None
     write = sys.stdout.buffer.write
 
-    def oneliner(b:str):
-        if b is None:
-            return ""
-        elif isinstance(b, str):
-            if "\r" in b:
-                b = b.replace("\r", "\\r")
-            if "\n" in b:
-                b = b.replace("\n", "\\n")
-            return b
+    if args.jobs == 1:
+        for i, f in enumerate(walk(args)):
+            for b in dumplines(f, **kw):
+                write(b)
+    else:
+        files = walk(args)
+        head = list(islice(files, 2))
+        sn = sniff(head[0]) if len(head) == 1 else None
+        if sn and sn.type in ("csv", "txt") and splittable(sn.encoding):
+            # byte ranges of a single flat file, its rows have no target
+            i, f = 0, head[0]
+            for b in maprows(partial(_dumprange, f=f, kw=kw), f, args.jobs or None, not args.unordered, sniffed=sn, window=args.window):
+                write(b)
         else:
-            return str(b)
-
-    for i, f in enumerate(walk(args)):
-        for x in readrow(f):
-            if filename:
-                write("{}:{}".format(x.path, sep).encode(encoding, errors="backslashreplace"))
-            if target:
-                write("[{}]{}".format(x.target, sep).encode(encoding, errors="backslashreplace"))
-            try:
-                write((x.value + lineterminator).encode(encoding, errors="backslashreplace"))
-            except TypeError:
-                write((sep.join(map(oneliner,x.value)) + lineterminator).encode(encoding, errors="backslashreplace"))
+            # other files (and a single xlsx, zip ...) are dumped whole by a worker, keeping the targets
+            # the spools of the jobs in flight (at most `window`) are removed with the directory on an error
+            with TemporaryDirectory(prefix="dumper") as tmpdir:
+                jobs = ((f, kw, tmpdir) for f in chain(head, files))
+                for i, spool in enumerate(pmap(_dumpfile, jobs, args.jobs, ordered=not args.unordered, window=args.window)):
+                    _unspool(spool, write)
 
     if i is None:
         raise FileNotFoundError(str(args.files))
@@ -2767,9 +3320,14 @@ def main_info():
          help='output fileencoding (default `\\r\\n`)')
     padd('-d', '--dateformat', type=str, default="%Y/%m/%d %H:%M:%S",
          help='output datetimeformat (default `%Y/%m/%d %H:%M:%S`)')
+    padd('--sniffcache', type=str, default=None,
+         help='sniff cache database path, keeps file types and csv dialects between runs (default None is in memory)')
 
     args = ps.parse_args()
 
+    if args.sniffcache:
+        setsniffcache(args.sniffcache)
+
     sep = args.sep
     lineterminator = args.lineterminator
     dateformat = args.dateformat
@@ -47,7 +47,7 @@ cdef inline object compare(object x, object y, object conditional_value, object
         return "{}{}{}".format(addstr, conditional_value, y)
 
 cpdef object sanitize(object a, object b, object conditional_value=' ---> ', object delstr='DEL', object addstr='ADD'):
-    if a is None or type(a) in BASE_TYPE and b is None or type(b) in BASE_TYPE:
+    if type(a) in BASE_TYPE and type(b) in BASE_TYPE:
         return compare(a, b, conditional_value, delstr, addstr)
     else:
         return [compare(x, y, conditional_value, delstr, addstr) for x, y in zip_longest(a, b, fillvalue="")]
@@ -68,20 +68,35 @@ cdef inline double c_dot(double a, double b):
     return a * b
 
 
-cdef inline long snake(long k, long y, object left, object right):
-    x = y - k
-    while x < len(left) and y < len(right) and left[x] == right[y]:
+cdef inline long snake(long k, long y, object left, object right, long l1, long l2):
+    cdef long x = y - k
+    while x < l1 and y < l2 and left[x] == right[y]:
         x += 1
         y += 1
     return y
 
 
+cdef double common_rate(object o1, object o2, long m):
+    cdef dict c1 = {}
+    cdef dict c2 = {}
+    cdef long common = 0
+    cdef long n, v
+    _count_elements(c1, o1)
+    _count_elements(c2, o2)
+    if len(c1) > len(c2):
+        c1, c2 = c2, c1
+    for k, n in c1.items():
+        v = c2.get(k, 0)
+        common += n if n < v else v
+    return c_minus(1.0, c_div(minus(m, common), m))
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cpdef double similar(object left, object right):
-    cdef long l1, l2
-    cdef long sl1, sl2, offset, delta, p
-    cdef double ed
+cpdef double similar(object left, object right, double min_rate=0.0):
+    cdef long l1, l2, m
+    cdef long sl1, sl2, offset, delta, p, k
+    cdef double ed, bound
     cdef vector[long] fp
 
     if left == right:
@@ -90,9 +105,6 @@ cpdef double similar(object left, object right):
     if not (left and right):
         return 0.0
 
-    if distance and isinstance(left, str) and isinstance(right, str):
-        return c_minus(1.0, c_div(distance(left, right), max(len(left), len(right))))
-
     try:
         l1, l2 = len(left), len(right)
         o1, o2 = left, right
@@ -101,8 +113,23 @@ cpdef double similar(object left, object right):
         o2 = list(right)
         l1, l2 = len(o1), len(o2)
 
+    m = max(l1, l2)
+    if min_rate > 0.0:
+        bound = c_minus(1.0, c_div(abs(minus(l1, l2)), m))
+        if bound < min_rate:
+            return bound
+        try:
+            bound = common_rate(o1, o2, m)
+        except TypeError:
+            bound = 1.0
+        if bound < min_rate:
+            return bound
+
+    if distance and isinstance(left, str) and isinstance(right, str):
+        return c_minus(1.0, c_div(distance(left, right), m))
+
     if onpdistance:
-        return 1.0 - (onpdistance(left, right) / max(l1, l2))
+        return 1.0 - (onpdistance(left, right) / m)
     else:
         s1 = o2 if l1 > l2 else o1
         s2 = o1 if l1 > l2 else o2
@@ -112,20 +139,25 @@ cpdef double similar(object left, object right):
 
         offset = sl1 + 1
         delta = sl2 - sl1
-        
-        fp = [-1 for _ in range(sl1 + sl2 + 1)]
+
+        # k runs -p..delta+p with p <= sl1, so fp[k-1+offset]..fp[k+1+offset] stays in 0..sl1+sl2+2
+        fp.assign(sl1 + sl2 + 3, -1)
 
         p = 0
         while fp[delta + offset] != sl2:
+            if min_rate > 0.0:
+                bound = c_minus(1.0, c_div(delta + p, m))
+                if bound < min_rate:
+                    return bound
             for k in range(-1 * p, delta):
-                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
+                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2, sl1, sl2)
             for k in range(delta + p, delta, -1):
-                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2)
-            fp[delta + offset] = snake(delta, max(fp[delta-1+offset] + 1, fp[delta+1+offset]), s1, s2)
+                fp[k + offset] = snake(k, max(fp[k-1+offset] + 1, fp[k+1+offset]), s1, s2, sl1, sl2)
+            fp[delta + offset] = snake(delta, max(fp[delta-1+offset] + 1, fp[delta+1+offset]), s1, s2, sl1, sl2)
 
             p += 1
 
         ed = c_add(delta, c_minus(p, 1))
 
-        return 1.0 - c_div(ed, max(l1,l2))
+        return 1.0 - c_div(ed, m)
 
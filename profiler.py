@@ -17,7 +17,7 @@ __all__ = [
         "profile_data",
 ]
 
-from itertools import  zip_longest
+from itertools import  zip_longest, islice
 from  collections import  _count_elements
 import heapq
 from collections import namedtuple
@@ -25,9 +25,17 @@ import sys
 import csv
 import os
 from itertools import combinations
+from operator import itemgetter
 
-from util.io import readrow, grouprow, to_csv, to_tsv, unicode_escape
-from util.filetype import guesstype
+from util.io import readrow, grouprow, csvrows, xlsxrows, to_csv, to_tsv, unicode_escape
+from util.io import blocklines as _blocklines, byteranges, splittable
+from util.filetype import guesstype, dialectparams, setsniffcache
+from util.utils import is_date
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
 
 BASE_TYPE = (type(None), int, float, str, bytes, bytearray, bool)
 def deeptuple(x):
@@ -37,64 +45,412 @@ def deeptuple(x):
         return (x, )
 
 ret = namedtuple("Profile",
-    ["rec_count", "is_notnull", "is_uniq", "notnull_count", "null_count", "uniq_count", "fill_rate", "uniq_rate", "key_rate", "top"]
+    ["rec_count", "is_notnull", "is_uniq", "notnull_count", "null_count", "uniq_count", "fill_rate", "uniq_rate", "key_rate", "top",
+     "type", "min", "max", "mean", "std", "quantiles", "len_min", "len_max", "len_mean"]
 )
 
-
-def guess_key(profile, n=10):
-    keys = sorted([(v.key_rate, k) for k, v in profile.items()])[-19:]
-    result = []
-    for i in range(1, len(keys)):
-        for x in combinations(keys, i):
-            rk = []
-            rv = 0
-            for v, k in x:
-                rk.append(k)
-                rv += v ** v
-            result.append((rv**0.5, rk))
-    return [k for v, k in sorted(result, reverse=True)[:n]]
-
-def profile_data(rows, header=None, top=10, na_val=[None, "", "N/A", "NULL", "null", "none", "na"]):
-    result = {}
-
-    rec = None
-    col = []
-
-    if isinstance(header, int):
-        if hasattr(rows, "__next__"):
-            for i in range(header + 1):
-                col = next(rows)
+NA_VALUE = [None, "", "N/A", "NULL", "null", "none", "na"]
+
+class hyperloglog(object):
+    """
+        HyperLogLog distinct counter. (relative error about 1.04 / sqrt(2 ** p))
+        values are hashed by blake2b of the repr, which is same in every process
+        (`hash` of str is salted per process, so it can not be merged)
+    """
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def update(self, values):
+        from hashlib import blake2b
+        frombytes = int.from_bytes
+        p = self.p
+        q = 64 - p
+        mask = (1 << q) - 1
+        reg = self.registers
+        for x in values:
+            h = frombytes(blake2b(repr(x).encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+            j = h >> q
+            r = q - (h & mask).bit_length() + 1
+            if reg[j] < r:
+                reg[j] = r
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def __len__(self):
+        from math import log
+        m = self.m
+        e = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if e <= 2.5 * m and zeros:
+            e = m * log(m / zeros)
+        return int(round(e))
+
+class spacesaving(object):
+    """
+        Space-Saving frequent values summary. (mergeable)
+        keeps the `capacity` most frequent values,
+        a kept count is over estimated by at most the largest dropped count.
+    """
+    def __init__(self, capacity=1000, counts=None):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+        if counts:
+            self.update(counts)
+
+    def update(self, counts):
+        c = self.counts
+        get = c.get
+        error = self.error
+        for k, v in counts.items():
+            c[k] = get(k, error) + v
+        if len(c) > self.capacity * 2:
+            self.reduce()
+
+    def reduce(self):
+        c = self.counts
+        if len(c) > self.capacity:
+            keep = heapq.nlargest(self.capacity + 1, c.items(), key=lambda x: x[1])
+            self.error = max(self.error, keep.pop()[1])
+            self.counts = dict(keep)
+
+    def merge(self, other):
+        self.error += other.error
+        self.update(other.counts)
+        return self
+
+    def top(self, n):
+        self.reduce()
+        return heapq.nlargest(n, self.counts, key=self.counts.get)
+
+class kll(object):
+    """
+        KLL quantile sketch. (mergeable, rank error about 1.65 / k)
+        compactors keep sorted halves alternately (deterministic), an item of level h weighs 2 ** h.
+    """
+    def __init__(self, k=200):
+        self.k = k
+        self.compactors = []
+        self.offsets = []
+        self.size = 0
+        self.maxsize = 0
+        self.grow()
+
+    def grow(self):
+        self.compactors.append([])
+        self.offsets.append(0)
+        self.maxsize = sum(map(self.capacity, range(len(self.compactors))))
+
+    def capacity(self, h):
+        return int(self.k * (2 / 3) ** (len(self.compactors) - h - 1)) + 2
+
+    def update(self, values):
+        """ large batch is sorted once and sampled into the level of matching weight """
+        h = 0
+        while len(values) >> h > self.k:
+            h += 1
+        if h:
+            while len(self.compactors) <= h:
+                self.grow()
+            values = sorted(values)
+            values = values[self.offsets[h - 1] * ((1 << h) - 1)::1 << h]
+            self.offsets[h - 1] ^= 1
+        self.compactors[h].extend(values)
+        self.size += len(values)
+        self.compress()
+
+    def compress(self):
+        while self.size >= self.maxsize:
+            for h, c in enumerate(self.compactors):
+                if len(c) >= self.capacity(h):
+                    if h + 1 >= len(self.compactors):
+                        self.grow()
+                    c.sort()
+                    self.compactors[h + 1].extend(c[self.offsets[h]::2])
+                    self.offsets[h] ^= 1
+                    c.clear()
+                    break
+            self.size = sum(map(len, self.compactors))
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.grow()
+        for h, c in enumerate(other.compactors):
+            self.compactors[h].extend(c)
+        self.size = sum(map(len, self.compactors))
+        self.compress()
+        return self
+
+    def quantiles(self, qs=(0.25, 0.5, 0.75)):
+        items = sorted((v, 1 << h) for h, c in enumerate(self.compactors) for v in c)
+        if not items:
+            return []
+        total = sum(w for _, w in items)
+        result = []
+        i = cum = 0
+        for q in qs:
+            while i < len(items) - 1 and cum + items[i][1] < q * total:
+                cum += items[i][1]
+                i += 1
+            result.append(items[i][0])
+        return result
+
+class valuestats(object):
+    """
+        Typed value statistics of a column. (mergeable)
+        type inference of int, float, date (`utils.is_date`) and string,
+        min / max / mean / std (Welford and Chan merge) and `kll` quantiles of numeric values,
+        length statistics of the values as string.
+        a batch of all numeric values is converted at once by numpy (if installed).
+    """
+    def __init__(self):
+        self.types = dict(int=0, float=0, date=0, string=0)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.quantile = kll()
+        self.len_n = 0
+        self.len_sum = 0
+        self.len_min = None
+        self.len_max = None
+
+    @staticmethod
+    def valuetype(v):
+        t = type(v)
+        if t is int or t is bool:
+            return "int", v
+        if t is float:
+            return "float", v
+        if t is str:
+            try:
+                return "int", int(v)
+            except ValueError:
+                pass
+            try:
+                return "float", float(v)
+            except ValueError:
+                pass
+            if is_date(v):
+                return "date", None
+        elif hasattr(v, "year") and hasattr(v, "month"):
+            return "date", None
+        return "string", None
+
+    def numbers(self, values, kinds):
+        """ Return: tuple (type, numeric values) of the batch """
+        if np is not None:
+            try:
+                if kinds <= {str, int, bool}:
+                    return "int", np.array(values, dtype=np.int64)
+                if kinds <= {int, float, bool}:
+                    return "float", np.array(values, dtype=np.float64)
+            except (ValueError, OverflowError, TypeError):
+                pass
+            if kinds <= {str}:
+                try:
+                    return "float", np.array(values, dtype=np.float64)
+                except ValueError:
+                    pass
+        return None, None
+
+    def update(self, values):
+        if not values:
+            return
+
+        kinds = set(map(type, values))
+        lens = list(map(len, values if kinds == {str} else map(str, values)))
+        self.len_n += len(lens)
+        self.len_sum += sum(lens)
+        self.len_min = min(lens) if self.len_min is None else min(self.len_min, min(lens))
+        self.len_max = max(lens) if self.len_max is None else max(self.len_max, max(lens))
+
+        types = self.types
+        if types["string"]:
+            types["string"] += len(values)
+            return
+
+        kind, arr = self.numbers(values, kinds)
+        if kind:
+            types[kind] += len(values)
+            self.moments(len(arr), float(arr.mean()), float(arr.var()) * len(arr), arr.min().item(), arr.max().item())
+            self.quantile.update(np.sort(arr).tolist())
+            return
+
+        nums = []
+        for i, v in enumerate(values):
+            t, x = self.valuetype(v)
+            if t == "string":
+                types["string"] += len(values) - i
+                break
+            types[t] += 1
+            if x is not None:
+                nums.append(x)
+
+        if nums:
+            n = len(nums)
+            mean = sum(nums) / n
+            self.moments(n, mean, sum((x - mean) ** 2 for x in nums), min(nums), max(nums))
+            self.quantile.update(nums)
+
+    def moments(self, n, mean, m2, mn, mx):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = mn if self.min is None else min(self.min, mn)
+        self.max = mx if self.max is None else max(self.max, mx)
+
+    def merge(self, other):
+        for k, v in other.types.items():
+            self.types[k] += v
+        if other.n:
+            self.moments(other.n, other.mean, other.m2, other.min, other.max)
+        self.quantile.merge(other.quantile)
+        if other.len_n:
+            self.len_n += other.len_n
+            self.len_sum += other.len_sum
+            self.len_min = other.len_min if self.len_min is None else min(self.len_min, other.len_min)
+            self.len_max = other.len_max if self.len_max is None else max(self.len_max, other.len_max)
+        return self
+
+    @property
+    def type(self):
+        t = self.types
+        if t["string"] or (t["date"] and (t["int"] or t["float"])):
+            return "string"
+        if t["date"]:
+            return "date"
+        if t["float"]:
+            return "float"
+        if t["int"]:
+            return "int"
+        return None
+
+    def result(self):
+        """ Return: list (type, min, max, mean, std, quantiles, len_min, len_max, len_mean) """
+        t = self.type
+        if t in ("int", "float") and self.n:
+            num = [self.min, self.max, self.mean, (self.m2 / self.n) ** 0.5, self.quantile.quantiles()]
         else:
-            col, *rows = rows[header:]
-    elif isinstance(header, (list, tuple)):
-        col = header
-
-    for i, x in enumerate(zip_longest(*rows)):
-        if rec is None:
-            rec = len(x)
+            num = [None, None, None, None, []]
+        ln = [self.len_min, self.len_max, self.len_sum / self.len_n if self.len_n else None]
+        return [t, *num, *ln]
+
+class colprofile(object):
+    """
+        Streaming (single pass) profile state of a column.
+        values are counted exactly until `limit` distinct values (or always if `exact`),
+        then the distinct count goes to `hyperloglog` and the frequent values to `spacesaving`.
+        a sketched column without a duplicate or null value so far keeps the set of its values,
+        so that `is_uniq` (and the distinct count of a unique column) is never an estimate.
+    """
+    def __init__(self, na_val=NA_VALUE, exact=False, limit=1 << 16, capacity=1000):
+        self.na_val = na_val if isinstance(na_val, (set, frozenset)) else set(na_val)
+        self.limit = None if exact else limit
+        self.capacity = capacity
+        self.rec = 0
+        self.notna = 0
+        self.counter = {}
+        self.hll = None
+        self.freq = None
+        self.seen = None
+        self.stats = valuestats()
+
+    def update(self, values):
+        na = self.na_val
+        x = [y for y in values if y not in na]
+        self.rec += len(values)
+        self.notna += len(x)
+        self.stats.update(x)
+
+        if self.hll is None:
+            _count_elements(self.counter, x)
+            if self.limit is not None and len(self.counter) > self.limit:
+                self.sketch()
+        else:
+            counter = {}
+            _count_elements(counter, x)
+            self.hll.update(counter)
+            self.freq.update(counter)
+            if self.seen is not None:
+                self.unique(counter, len(x) == len(values))
+
+    def skip(self, n):
+        """ `n` missing values (short rows) """
+        if n > 0:
+            if None in self.na_val:
+                self.rec += n
+                self.seen = None
+            else:
+                self.update([None] * n)
+
+    def merge(self, other):
+        self.rec += other.rec
+        self.notna += other.notna
+        self.stats.merge(other.stats)
+        if self.hll is None and other.hll is None:
+            c = self.counter
+            get = c.get
+            for k, v in other.counter.items():
+                c[k] = get(k, 0) + v
+            if self.limit is not None and len(c) > self.limit:
+                self.sketch()
+        else:
+            if self.hll is None:
+                self.sketch()
+            if other.hll is None:
+                other.sketch()
+            self.hll.merge(other.hll)
+            self.freq.merge(other.freq)
+            if self.seen is not None:
+                if other.seen is None:
+                    self.seen = None
+                else:
+                    self.unique(dict.fromkeys(other.seen, 1))
+        return self
 
-        counter = {}
-        gc = counter.get
+    def unique(self, counter, notna=True):
+        """ add the distinct values of a sketched column to `seen` while it is still unique """
+        if notna and all(v == 1 for v in counter.values()) and self.seen.isdisjoint(counter):
+            self.seen.update(counter)
+        else:
+            self.seen = None
+
+    def sketch(self):
+        self.hll = hyperloglog()
+        self.hll.update(self.counter)
+        self.freq = spacesaving(self.capacity, self.counter)
+        if self.rec == self.notna and all(v == 1 for v in self.counter.values()):
+            self.seen = set(self.counter)
+        self.counter = {}
+
+    def result(self, top=10):
+        rec = self.rec
+        notna_n = self.notna
+        na_n = rec - notna_n
 
-        _count_elements(counter, [y for y in x if y not in na_val])
+        if self.hll is None:
+            uq_n = len(self.counter)
+            topN = heapq.nlargest(top, self.counter, key=self.counter.get) if top > 0 else []
+        else:
+            uq_n = min(len(self.hll), notna_n) if self.seen is None else len(self.seen)
+            topN = self.freq.top(top) if top > 0 else []
 
-        uq_n = len(counter)
         uq_rate = uq_n / rec
-
-        notna_n = sum(counter.values())
-
-        topN = heapq.nlargest(top, counter, key=gc) if top > 0 else []
-
-        del counter, gc
-
-        na_n = rec - notna_n
         fill_rate = notna_n / rec
         if uq_rate > 0 and fill_rate > 0:
             key_rate = (uq_rate * fill_rate) / ((pow(uq_rate, 2) + pow(fill_rate, 2)) ** 0.5)
         else:
             key_rate = 0.0
 
-        info = ret(
+        return ret(
             rec,
             rec == notna_n,
             rec == uq_n,
@@ -104,14 +460,247 @@ def profile_data(rows, header=None, top=10, na_val=[None, "", "N/A", "NULL", "nu
             fill_rate,
             uq_rate,
             key_rate,
-            topN
+            topN,
+            *self.stats.result()
         )
 
-        k = col[i] if i < len(col) else i
 
-        result[k] = info
+def guess_key(profile, n=10, rows=None, sample=10000, maxsize=4, beam=32):
+    """
+        Candidate (minimal) composite keys of a table.
+
+        Parameters:
+            profile: result of `profile_data` (keys in column order)
+            rows: data rows of the profile.
+                  the column sets are searched level by level (apriori) on the first `sample` rows
+                  by the distinct count of the value tuples, supersets of found keys are pruned
+                  and only the `beam` most distinct non key sets are extended,
+                  then the keys are confirmed on all rows (if `rows` is a sequence)
+                  and searched again on all rows when a sample key is rejected.
+                  without `rows`, the sets are only ranked by the profile.
+            maxsize: max column number of a key
+        Return:
+            list (list of profile keys) in order of fewer columns, higher fill rate and key rate
+    """
+    names = list(profile)
+    if rows is None:
+        return _guess_key_profile(profile, names, n, maxsize)
+
+    w = len(names)
+    head = rows[:sample] if hasattr(rows, "__getitem__") else list(islice(rows, sample))
+    m = len(head)
+    if m == 0 or w == 0:
+        return []
+
+    def padded(data):
+        return [r if len(r) >= w else list(r) + [None] * (w - len(r)) for r in data]
+
+    def distinct(cols, data):
+        return len(set(map(itemgetter(*cols), data)))
+
+    def rank(cols):
+        infos = [profile[names[i]] for i in cols]
+        return (len(cols), -min(x.fill_rate for x in infos), -sum(x.key_rate for x in infos), cols)
+
+    def search(data):
+        m = len(data)
+        keys = []
+        level = []
+        singles = []
+        for i in range(w):
+            d = distinct((i,), data)
+            if d == m:
+                keys.append((i,))
+            elif d > 1:
+                level.append(((i,), d))
+                singles.append(i)
+
+        size = 1
+        while level and size < maxsize and len(keys) < n:
+            size += 1
+            level = sorted(level, key=lambda x: (-x[1], x[0]))[:beam]
+            seen = set()
+            nxt = []
+            for cols, _ in level:
+                for i in singles:
+                    if i in cols:
+                        continue
+                    cand = tuple(sorted(cols + (i,)))
+                    if cand in seen or any(set(k) <= set(cand) for k in keys):
+                        continue
+                    seen.add(cand)
+                    d = distinct(cand, data)
+                    if d == m:
+                        keys.append(cand)
+                    else:
+                        nxt.append((cand, d))
+            level = nxt
+
+        return sorted(keys, key=rank)
+
+    keys = search(padded(head))
+
+    def isunique(cols, block=8192):
+        # blockwise, so that a non key exits at the first block with a duplicate
+        seen = set()
+        getter = itemgetter(*cols)
+        for i in range(0, len(rows), block):
+            part = rows[i:i + block]
+            try:
+                seen.update(map(getter, part))
+            except IndexError:
+                seen.update(map(getter, padded(part)))
+            if len(seen) < i + len(part):
+                return False
+        return True
+
+    if hasattr(rows, "__getitem__") and len(rows) > m:
+        confirmed = []
+        for cols in keys:
+            if isunique(cols):
+                confirmed.append(cols)
+                if len(confirmed) >= n:
+                    break
+        if len(confirmed) < min(n, len(keys)):
+            # a sample key is not unique on all rows, its supersets were never searched
+            confirmed = search(padded(rows))
+        keys = confirmed
+
+    return [[names[i] for i in cols] for cols in keys[:n]]
+
+def _guess_key_profile(profile, names, n=10, maxsize=4, top=8, error=0.02):
+    """
+        guess keys from the profile only: estimated uniqueness of the product of distinct counts.
+        (`error` is the tolerance of the sketched uniq_count)
+    """
+    cols = sorted(range(len(names)), key=lambda i: -profile[names[i]].key_rate)[:top]
+    result = []
+    for size in range(1, maxsize + 1):
+        for x in combinations(cols, size):
+            infos = [profile[names[i]] for i in x]
+            rec = infos[0].rec_count or 1
+            est = 1
+            for v in infos:
+                est *= max(v.uniq_count, 1)
+            result.append((-min(est / rec + error, 1.0), size, -sum(v.key_rate for v in infos), x))
+    return [[names[i] for i in x] for *_, x in sorted(result)[:n]]
+
+class tableprofile(object):
+    """
+        Mergeable streaming profile state of a table (list of `colprofile`).
+        a state of each part of the rows can be built in parallel and merged in order.
+    """
+    def __init__(self, na_val=NA_VALUE, exact=False):
+        self.na_val = set(na_val)
+        self.exact = exact
+        self.n = 0
+        self.cols = []
+
+    def update(self, rows, batch=4096):
+        cols = self.cols
+        it = iter(rows)
+        while True:
+            chunk = list(islice(it, batch))
+            if not chunk:
+                break
+
+            w = 0
+            for w, x in enumerate(zip_longest(*chunk), 1):
+                if w > len(cols):
+                    c = colprofile(self.na_val, self.exact)
+                    c.skip(self.n)
+                    cols.append(c)
+                cols[w - 1].update(x)
+
+            for c in cols[w:]:
+                c.skip(len(chunk))
+
+            self.n += len(chunk)
+        return self
+
+    def merge(self, other):
+        for i, c in enumerate(other.cols):
+            if i == len(self.cols):
+                self.cols.append(colprofile(self.na_val, self.exact))
+                self.cols[i].skip(self.n)
+            self.cols[i].merge(c)
+        for c in self.cols[len(other.cols):]:
+            c.skip(other.n)
+        self.n += other.n
+        return self
+
+    def result(self, header=None, top=10):
+        col = header or []
+        return {col[i] if i < len(col) else i: c.result(top) for i, c in enumerate(self.cols)}
+
+def profile_data(rows, header=None, top=10, na_val=NA_VALUE, exact=False, batch=4096):
+    """
+        Single pass column profile of rows.
+        (rows are read `batch` rows at a time, memory is bounded by the column sketches unless `exact`,
+         and the value set of a column that is unique so far)
+    """
+    col = []
 
-    return result
+    if isinstance(header, int):
+        if hasattr(rows, "__next__"):
+            for i in range(header + 1):
+                col = next(rows)
+        else:
+            col, *rows = rows[header:]
+    elif isinstance(header, (list, tuple)):
+        col = header
+
+    return tableprofile(na_val, exact).update(rows, batch).result(col, top)
+
+def blocklines(path, encoding, start=0, end=None, blocksize=1 << 22, newline="\n"):
+    """
+        decoded lines (line ends kept) of a byte range of a file.
+        the file is read and decoded `blocksize` bytes at a time and split only at `newline`.
+    """
+    with open(path, "rb") as fp:
+        fp.seek(start)
+        yield from _blocklines(fp, encoding, size=None if end is None else end - start, blocksize=blocksize, newline=newline)
+
+def _profile_range(job):
+    path, start, end, encoding, dialect, newline, skip, na_val, exact = job
+    reader = csv.reader(blocklines(path, encoding, start, end, newline=newline), **dialect)
+    col = []
+    for row in islice(reader, skip):
+        col = row
+    return col, tableprofile(na_val, exact).update(reader)
+
+def profile_csv(path, header=None, top=10, na_val=NA_VALUE, exact=False, jobs=None, chunksize=16 * 1024 ** 2, sniffed=None):
+    """
+        Parallel `profile_data` of a large csv file.
+        the file is split at record boundaries (quote aware) into byte ranges,
+        each range is profiled in a process pool and the states are merged in order.
+        the `header` records are read by the csv reader of the first range.
+
+        Parameters:
+            sniffed: `util.filetype.sniff` result of the file (encoding, dialect and line terminator)
+    """
+    from util.filetype import sniff
+    from util.utils import pmap
+
+    sn = sniffed or sniff(path)
+    encoding = sn.encoding or "utf-8"
+    dialect = sn.dialect or dialectparams(csv.excel)
+    newline = "\r" if sn.lineterminator == "\r" else "\n"
+    skip = header + 1 if isinstance(header, int) else 0
+
+    # a "\r" terminated file has no "\n" to split at
+    n = -(-os.path.getsize(path) // chunksize) if splittable(encoding) and newline == "\n" else 1
+    quotechar = dialect["quotechar"] if dialect["quoting"] != csv.QUOTE_NONE else None
+
+    state = tableprofile(na_val, exact)
+    parts = [(path, s, e, encoding, dialect, newline, skip if i == 0 else 0, state.na_val, exact)
+             for i, (s, e) in enumerate(byteranges(path, n, 0, quotechar))]
+    col = header if isinstance(header, (list, tuple)) else []
+    for i, (c, part) in enumerate(pmap(_profile_range, parts, jobs if len(parts) > 1 else 1)):
+        col = c if i == 0 and skip else col
+        state.merge(part)
+
+    return state.result(col, top)
 
 def profiler(
     path_or_buffer,
@@ -119,31 +708,80 @@ def profiler(
     top=10,
     na_val = [None, "", "N/A", "NULL", "null","none", "na"],
     headerout=True,
+    exact=False,
+    jobs=1,
     ):
 
     kw = dict(
         header=header,
         top=top,
         na_val=na_val,
+        exact=exact,
     )
 
     head = []
+    ftype = guesstype(path_or_buffer)
 
     try:
-        if guesstype(path_or_buffer) in {"ppt","doc","csv","txt","html","pickle"}:
+        if ftype in {"ppt","doc","csv","txt","html","pickle"}:
             raise ValueError
 
-        rows = grouprow(path_or_buffer)
+        if ftype == "xlsx":
+            rows = ((None, sname, row) for sname, row in xlsxrows(path_or_buffer))
+        else:
+            rows = grouprow(path_or_buffer)
 
         if headerout:
             head = [["targetname", "columns", *ret._fields]]
         return head + [[pk, ck, *cv] for _, pk, row in rows for ck, cv in profile_data(row, **kw).items()]
     except ValueError:
-        rows = (x.value for x in readrow(path_or_buffer))
         if headerout:
             head = [["columns", *ret._fields]]
+        if isinstance(path_or_buffer, (str, os.PathLike)) and ftype == "csv" and jobs != 1:
+            return head + [[k, *v] for k, v in profile_csv(path_or_buffer, jobs=jobs, **kw).items()]
+        if ftype == "csv":
+            rows = (row for rows in csvrows(path_or_buffer) for row in rows)
+        else:
+            rows = (x.value for x in readrow(path_or_buffer))
         return head + [[k, *v] for k, v in profile_data(rows, **kw).items()]
 
+def keyfinder(
+    path_or_buffer,
+    header=None,
+    n=10,
+    na_val = [None, "", "N/A", "NULL", "null","none", "na"],
+    headerout=True,
+    exact=False,
+    **kw
+    ):
+    """ candidate composite keys of each table (see `guess_key`) """
+
+    def keys(rows):
+        rows = list(rows)
+        data = rows[header + 1:] if isinstance(header, int) else rows
+        profile = profile_data(rows, header=header, top=0, na_val=na_val, exact=exact)
+        return enumerate((",".join(map(str, k)) for k in guess_key(profile, n, data)), 1)
+
+    head = []
+    ftype = guesstype(path_or_buffer)
+
+    try:
+        if ftype in {"ppt","doc","csv","txt","html","pickle"}:
+            raise ValueError
+
+        if ftype == "xlsx":
+            rows = ((None, sname, row) for sname, row in xlsxrows(path_or_buffer))
+        else:
+            rows = grouprow(path_or_buffer)
+
+        if headerout:
+            head = [["targetname", "rank", "columns"]]
+        return head + [[pk, i, k] for _, pk, row in rows for i, k in keys(row)]
+    except ValueError:
+        if headerout:
+            head = [["rank", "columns"]]
+        return head + [[i, k] for i, k in keys(x.value for x in readrow(path_or_buffer))]
+
 def to_excel(rows, outputfile, sheetname="Sheet1",
             header = True, startrow=0, startcol=0, conditional_value=" ---> "):
     import xlsxwriter
@@ -191,9 +829,131 @@ def to_excel(rows, outputfile, sheetname="Sheet1",
 
 defaultencoding = "cp932" if os.name == "nt" else "utf-8"
 
+class profilecache(object):
+    """
+        Persistent cache of `profiler` / `keyfinder` result rows (sqlite3).
+        an entry is keyed by the path and the options, and is valid while
+        the file size, mtime and the hash of its head and tail 64KiB are unchanged.
+        least recently used entries over `maxsize` and entries unused for `maxage` seconds are evicted on close.
+        the rows are stored as json (a value of another type as its str, as it is written to csv),
+        a locked or busy database is a cache miss and the entry is not written.
+
+        Parameters:
+            path: cache database path (default `$XDG_CACHE_HOME/util/profiler.sqlite3`)
+            timeout: seconds to wait for a lock of another process
+    """
+    version = 2
+
+    def __init__(self, path=None, maxsize=10000, maxage=30 * 86400, timeout=5.0):
+        import sqlite3
+
+        if path is None:
+            root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+            path = os.path.join(root, "util", "profiler.sqlite3")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.maxsize = maxsize
+        self.maxage = maxage
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.con = sqlite3.connect(path, timeout=timeout)
+        with self.con:
+            self.con.execute("""CREATE TABLE IF NOT EXISTS profile (
+                path TEXT, options TEXT, size INTEGER, mtime INTEGER, digest BLOB, atime REAL, result TEXT,
+                PRIMARY KEY (path, options))""")
+
+    @staticmethod
+    def fingerprint(path):
+        """ Return: tuple (size, mtime_ns, head and tail digest) """
+        from hashlib import blake2b
+        from util.filetype import headtail
+
+        st = os.stat(path)
+        with open(path, "rb") as fp:
+            digest = blake2b(headtail(fp, 65536), digest_size=16).digest()
+        return st.st_size, st.st_mtime_ns, digest
+
+    def key(self, path, options):
+        return os.path.abspath(path), repr(sorted((k, options[k]) for k in options if k != "jobs") + [self.version])
+
+    def get(self, path, options, fingerprint=None):
+        """
+            Parameters:
+                fingerprint: `fingerprint` of the file (default is taken now)
+            Return: cached result rows or None
+        """
+        import json
+        import sqlite3
+        from time import time
+
+        path, opt = self.key(path, options)
+        try:
+            row = self.con.execute("SELECT size, mtime, digest, result FROM profile WHERE path = ? AND options = ?", (path, opt)).fetchone()
+            if row and tuple(row[:3]) == (fingerprint or self.fingerprint(path)):
+                result = json.loads(row[3])
+                with self.con:
+                    self.con.execute("UPDATE profile SET atime = ? WHERE path = ? AND options = ?", (time(), path, opt))
+                self.hits += 1
+                return result
+        except (sqlite3.OperationalError, ValueError, TypeError):
+            self.errors += 1
+        self.misses += 1
+        return None
+
+    def put(self, path, options, result, fingerprint=None):
+        """
+            Parameters:
+                fingerprint: `fingerprint` of the file taken before it was profiled
+                             (a file changed while profiled is not a hit later)
+        """
+        import json
+        import sqlite3
+        from time import time
+
+        path, opt = self.key(path, options)
+        value = json.dumps(result, ensure_ascii=False, default=str)
+        try:
+            with self.con:
+                self.con.execute("INSERT OR REPLACE INTO profile VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (path, opt, *(fingerprint or self.fingerprint(path)), time(), value))
+        except sqlite3.OperationalError:
+            self.errors += 1
+
+    def evict(self):
+        import sqlite3
+        from time import time
+
+        try:
+            with self.con:
+                self.con.execute("DELETE FROM profile WHERE atime < ?", (time() - self.maxage,))
+                self.con.execute("""DELETE FROM profile WHERE rowid NOT IN (
+                    SELECT rowid FROM profile ORDER BY atime DESC LIMIT ?)""", (self.maxsize,))
+        except sqlite3.OperationalError:
+            self.errors += 1
+
+    def close(self):
+        self.evict()
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _profile_file(job):
+    path, kw = job
+    if kw.get("n"):
+        return keyfinder(path, **kw)
+    return profiler(path, **kw)
+
 def main():
     from glob import glob
     from argparse import ArgumentParser
+    from util.utils import pmap
 
     ps = ArgumentParser(prog="differ",
                         description="data profile program\n")
@@ -221,8 +981,23 @@ def main():
          help='output index N/A value (default `-`)')
     padd('-t', '--top', type=int, default=10,
          help='frequency values top count (default `10`)')
+    padd('-j', '--jobs', type=int, default=1,
+         help='parallel process number, files of glob or chunks of a large csv (default `1`, `0` is cpu count)')
+    padd('-K', '--keys', type=int, default=0,
+         help='print N candidate composite keys instead of the profile (default `0`)')
+    padd('-E', '--exact', action='store_true', default=False,
+         help='exact uniq count and top values (default `False` is sketch over 65536 distinct values)')
+    padd('--cache', type=str, default=None,
+         help='profile cache database path (default `$XDG_CACHE_HOME/util/profiler.sqlite3`)')
+    padd('--no-cache', dest="nocache", action='store_true', default=False,
+         help='always profile files, do not read or write the cache')
+    padd('--sniffcache', type=str, default=None,
+         help='sniff cache database path, keeps file types and csv dialects between runs (default None is in memory)')
     args = ps.parse_args()
 
+    if args.sniffcache:
+        setsniffcache(args.sniffcache)
+
     def walk(args):
         for arg in args.filename:
             for f in glob(arg):
@@ -242,24 +1017,53 @@ def main():
     outfile = args.outfile
 
     def it():
-        i = None
-        for i, f in enumerate(walk(args)):
-            j = 0
-            for x in profiler(
-                f,
-                header=header,
-                top=top,
-                na_val=na_value,
-                headerout= i == 0,
-                ):
-                if i + j == 0:
-                    yield ["filename"] + x
-                else:
-                    yield [f] + x
-                j += 1
-        if i is None:
+        files = list(walk(args))
+        if not files:
             raise FileNotFoundError(str(args.filename))
 
+        jobs = args.jobs
+        kw = dict(
+            header=header,
+            top=top,
+            na_val=na_value,
+            exact=args.exact,
+            jobs=jobs if len(files) == 1 else 1,
+        )
+        if args.keys:
+            kw["n"] = args.keys
+
+        cache = None
+        if not args.nocache:
+            try:
+                cache = profilecache(args.cache)
+            except Exception as e:
+                sys.stderr.write("Cache disabled:{}\n".format(e))
+        try:
+            # fingerprints are taken before profiling, a file changed meanwhile is profiled again next time
+            prints = [cache and cache.fingerprint(f) for f in files]
+            cached = [cache and cache.get(f, kw, p) for f, p in zip(files, prints)]
+            if cache and args.verbose:
+                sys.stderr.write("Cache:{} hits, {} misses\n".format(cache.hits, cache.misses))
+
+            jobargs = ((f, dict(kw, headerout=True)) for f, c in zip(files, cached) if c is None)
+            results = iter(pmap(_profile_file, jobargs, jobs if len(files) > 1 else 1))
+
+            for i, (f, c, p) in enumerate(zip(files, cached, prints)):
+                rows = c
+                if rows is None:
+                    rows = next(results)
+                    if cache:
+                        cache.put(f, kw, rows, p)
+                for j, x in enumerate(rows):
+                    if j == 0:
+                        if i == 0:
+                            yield ["filename"] + x
+                    else:
+                        yield [f] + x
+        finally:
+            if cache:
+                cache.close()
+
     kw = dict(encoding=encoding, errors="backslashreplace")
     if outfile == sys.stdout:
         if hasattr(outfile, "reconfigure"):
@@ -330,9 +1134,181 @@ def test():
         assert(rr["B"].null_count == 2)
         assert(rr["B"].notnull_count == 1)
 
+    def test_profile_data_ragged():
+        a = [["a"], ["b", "x"], ["c"]]
+        r = profile_data(a, batch=1)
+        assert(r == profile_data(a))
+        assert(r[1].rec_count == 3)
+        assert(r[1].null_count == 2)
+
+    def test_profile_data_sketch():
+        a = ([i % 5000, i % 7] for i in range(100000))
+        r = profile_data(a)
+        assert(r[1].uniq_count == 7)
+        assert(4750 < r[0].uniq_count < 5250)
+        r = profile_data(([i, i % 3] for i in range(100000)), top=3)
+        assert(r[0].uniq_count == 100000)
+        assert(r[0].is_uniq is True)
+        assert(r[1].is_uniq is False)
+        assert(sorted(r[1].top) == [0, 1, 2])
+        r = profile_data(([i, i % 3] for i in list(range(100000)) + [5]), batch=7000)
+        assert(abs(r[0].uniq_count - 100000) < 3000)
+        assert(r[0].is_uniq is False)
+        r = profile_data(([i] for i in list(range(100000)) + [""]))
+        assert(r[0].is_uniq is False)
+
+    def test_profile_data_exact():
+        r = profile_data(([i] for i in range(100000)), exact=True)[0]
+        assert(r.uniq_count == 100000)
+        assert(r.is_uniq is True)
+
+    def test_tableprofile_merge():
+        a = [[str(i % 7), str(i)] for i in range(1000)] + [["x"]] * 10 + [["y", "z", "w"]]
+        r = profile_data(a)
+        for n in [1, 3, 10]:
+            state = tableprofile()
+            for i in range(n):
+                state.merge(tableprofile().update(a[i * len(a) // n:(i + 1) * len(a) // n]))
+            assert(state.result() == r)
+        # a unique column over the sketch limit stays unique across merges, a duplicate in another part is found
+        for a, uniq in [([[i] for i in range(100000)], True), ([[i] for i in range(100000)] + [[70000]], False)]:
+            state = tableprofile().update(a[:30000]).merge(tableprofile().update(a[30000:]))
+            assert(state.result()[0].is_uniq is uniq)
+
+    def test_profile_csv():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.csv")
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerows([["id", "v"]] + [[i, i % 13] for i in range(5000)])
+            r = profile_csv(path, header=0, jobs=2, chunksize=4096)
+            e = profile_data(list(csv.reader(open(path, newline=""))), header=0)
+            assert([x._replace(quantiles=None) for x in r.values()] == [x._replace(quantiles=None) for x in e.values()])
+            assert(all(abs(q - w) < 50 for q, w in zip(r["id"].quantiles, e["id"].quantiles)))
+            assert(r["v"].uniq_count == 13)
+
+            # quoted newlines in the header
+            path = os.path.join(d, "b.csv")
+            rows = [["i\r\nd", "v"]] + [[i, "a\nb" if i % 3 else "c"] for i in range(3000)]
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerows(rows)
+            r = profile_csv(path, header=0, jobs=2, chunksize=4096)
+            assert(list(r) == ["i\r\nd", "v"])
+            assert(r["v"].uniq_count == 2 and r["i\r\nd"].rec_count == 3000)
+            assert(profiler(path, header=0, jobs=2) == profiler(path, header=0))
+
+            # "\r" terminated records
+            path = os.path.join(d, "c.csv")
+            with open(path, "w", newline="") as f:
+                csv.writer(f, lineterminator="\r").writerows([["id", "v"]] + [[i, i % 7] for i in range(3000)])
+            r = profile_csv(path, header=0, jobs=2, chunksize=4096)
+            assert(r["id"].is_uniq and r["id"].rec_count == 3000 and r["v"].uniq_count == 7)
+
+    def test_blocklines():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.csv")
+            rows = [["あ", "a\r\nb"], ["い\u2028う", "c"]] * 100 + [["end", "x"]]
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(rows)
+            lines = list(blocklines(path, "utf-8", blocksize=7))
+            assert(all(x.endswith("\n") for x in lines))
+            assert(list(csv.reader(lines)) == rows)
+
+    def test_xlsxrows():
+        import openpyxl
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.xlsx")
+            wb = openpyxl.Workbook()
+            wb.active.title = "s1"
+            for r in [["id", "v"], [1, "a"], [2, None]]:
+                wb.active.append(r)
+            wb.create_sheet("s2").append(["x"])
+            wb.save(path)
+            assert(guesstype(path) == "xlsx")
+            assert([(s, list(r)) for s, r in xlsxrows(path)] == [("s1", [("id", "v"), (1, "a"), (2, None)]), ("s2", [("x",)])])
+            r = profiler(path, header=0, headerout=False)
+            assert([x[:6] for x in r] == [["s1", "id", 2, True, True, 2], ["s1", "v", 2, False, False, 1]])
+
+    def test_profilecache():
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, "a.csv")
+            with open(path, "w") as f:
+                f.write("a,b\n1,2\n")
+            kw = dict(header=0, top=10, jobs=4)
+            with profilecache(os.path.join(d, "c.sqlite3"), maxsize=1) as c:
+                assert(c.get(path, kw) is None)
+                c.put(path, kw, [["x", 1]])
+                assert(c.get(path, dict(kw, jobs=1)) == [["x", 1]])
+                assert(c.get(path, dict(kw, top=5)) is None)
+                with open(path, "a") as f:
+                    f.write("3,4\n")
+                assert(c.get(path, kw) is None)
+                assert((c.hits, c.misses) == (1, 3))
+                c.put(path, dict(kw, top=5), [])
+                c.put(path, kw, [])
+            with profilecache(os.path.join(d, "c.sqlite3")) as c:
+                assert(c.get(path, kw) == [])
+                assert(c.get(path, dict(kw, top=5)) is None)
+
+                # json rows, a value of another type is stored as its str
+                from datetime import datetime
+                c.put(path, kw, [["a", 1, 0.5, None, [1, "x"], datetime(2020, 1, 2)]])
+                assert(c.get(path, kw) == [["a", 1, 0.5, None, [1, "x"], "2020-01-02 00:00:00"]])
+                assert(c.con.execute("SELECT typeof(result) FROM profile").fetchone() == ("text",))
+
+                # the fingerprint taken before profiling: a file changed meanwhile is a miss
+                fp = c.fingerprint(path)
+                with open(path, "a") as f:
+                    f.write("5,6\n")
+                c.put(path, kw, [], fp)
+                assert(c.get(path, kw) is None)
+
+                # a locked database is a miss and the entry is skipped
+                import sqlite3
+                other = sqlite3.connect(c.path)
+                other.execute("BEGIN EXCLUSIVE")
+                c.con.execute("PRAGMA busy_timeout = 0")
+                c.put(path, kw, [["y"]])
+                assert(c.get(path, kw) is None and c.errors == 2)
+                other.rollback()
+                other.close()
+                c.put(path, kw, [["y"]])
+                assert(c.get(path, kw) == [["y"]])
+
+    def test_profile_data_stats():
+        a = [["1", "1.5", "2020/01/02", "abc", None]] * 2 + [["3", "2", "2021/02/03", "de", 5]]
+        r = profile_data(a)
+        assert([r[i].type for i in range(5)] == ["int", "float", "date", "string", "int"])
+        assert((r[0].min, r[0].max, r[0].quantiles) == (1, 3, [1, 1, 3]))
+        assert(abs(r[0].mean - 5 / 3) < 1e-9 and abs(r[0].std - (8 / 9) ** 0.5) < 1e-9)
+        assert((r[3].len_min, r[3].len_max) == (2, 3))
+        assert(r[4].mean == 5)
+        r = profile_data([[i] for i in range(100000)])[0]
+        assert(r.type == "int" and r.min == 0 and r.max == 99999)
+        assert(all(abs(q - e) < 2000 for q, e in zip(r.quantiles, [25000, 50000, 75000])))
+
     def test_guess_key():
-        a = profile_data((x.value for x in readrow(tdir+"diff1.xlsx")), header=0)
+        rows = [x.value for x in readrow(tdir+"diff1.xlsx")]
+        a = profile_data(rows, header=0)
         assert(len(guess_key(a, 10)) == 10)
+        for k in guess_key(a, 10, rows[1:]):
+            idx = [rows[0].index(c) for c in k]
+            assert(len(set(tuple(r[i] for i in idx) for r in rows[1:])) == len(rows) - 1)
+
+    def test_guess_key_composite():
+        rows = [[i // 10, i % 10, i % 3, "x"] for i in range(1000)]
+        p = profile_data(rows)
+        assert(guess_key(p, 5, rows) == [[0, 1]])
+        assert(guess_key(p, 5, rows, sample=100) == [[0, 1]])
+        rows.append([0, 0, 1, "y"])
+        assert(guess_key(profile_data(rows), 5, rows) == [[0, 1, 2], [0, 1, 3]])
+        assert(guess_key(p, 1) == [[0, 1]])
+        # column 0 is unique on the sample only, the supersets are searched on all rows
+        rows = [[i % 150, i // 150, "x"] for i in range(1500)]
+        assert(guess_key(profile_data(rows), 5, rows, sample=100) == [[0, 1]])
 
     def test_profiler():
         r = profiler(tdir+"test.csv")
@@ -26,7 +26,8 @@ def read_requirements(path):
 
 def cancompile():
     if os.name == "posix":
-        if which("gcc"):
+        # libs/similar.pyx is compiled as c++ (distutils: language=c++)
+        if which("g++") or which("c++"):
             return True
         else:
             return False
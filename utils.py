@@ -50,6 +50,7 @@ __all__ = [
     'iterrows',
     'listlike',
     'kwtolist',
+    'pmap',
     'getdialect',
     'sniffer',
     'back_to_path',
@@ -61,7 +62,7 @@ __all__ = [
 import re
 import sys
 from datetime import datetime
-from itertools import chain, zip_longest
+from itertools import chain, zip_longest, islice
 from io import IOBase, StringIO, BytesIO
 import fnmatch
 from copy import deepcopy
@@ -962,6 +963,43 @@ def kwtolist(key, start=1):
 
     return ret
 
+def pmap(func, iterable, jobs=None, ordered=True, window=None, executor=None):
+    """
+        Parallel map with bounded memory.
+        Only `window` (default jobs * 2) items are submitted at a time,
+        results are yielded in input order (ordered=True) or as completed.
+
+        Parameters:
+            func: picklable function (module level function)
+            jobs: worker number (default cpu count, `1` is serial map)
+            executor: concurrent.futures executor class (default ProcessPoolExecutor)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1:
+        yield from map(func, iterable)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from collections import deque
+
+    window = window or jobs * 2
+    it = iter(iterable)
+
+    with (executor or ProcessPoolExecutor)(jobs) as ex:
+        if ordered:
+            running = deque(ex.submit(func, x) for x in islice(it, window))
+            while running:
+                f = running.popleft()
+                running.extend(ex.submit(func, x) for x in islice(it, 1))
+                yield f.result()
+        else:
+            running = {ex.submit(func, x) for x in islice(it, window)}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                running.update(ex.submit(func, x) for x in islice(it, len(done)))
+                for f in done:
+                    yield f.result()
+
 PROP_HEADER = ["fullpath", "parent", "basename", "extention",
           "owner", "group", "permision",
           "cdate", "mdate", "filesize"] + ["DIR"+str(i) for i in range(1,11)]
@@ -1308,6 +1346,11 @@ if __name__ == "__main__":
             assert(to_datetime("Fri Aug. 24, 2001 8:10 p.m.") == a2)
             assert(to_datetime("Fri Aug. 24, 2001 20:10") == a2)
 
+        def test_pmap():
+            assert(list(pmap(abs, range(-10, 0), 1)) == list(range(10, 0, -1)))
+            assert(list(pmap(abs, range(-10, 0), 2, window=3)) == list(range(10, 0, -1)))
+            assert(sorted(pmap(abs, range(-10, 0), 2, ordered=False)) == list(range(1, 11)))
+
         def test_to_gengo():
             a1 = datetime(1945,8,15)
 